@@ -0,0 +1,328 @@
+import json
+from datetime import datetime
+
+import dateutil.parser
+from flask import Blueprint, Response, request, abort
+
+from models import db, Area, Venue, Artiste, Show, ShowArchive
+from pagination import keyset_page, decode_cursor
+import search
+from archive import shows_from
+from availability import free_venue_ids
+from forms import GENRE_CHOICES
+from genres import selected_genres, genre_criteria
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+api = Blueprint('api_v1', __name__, url_prefix='/api/v1')
+
+def show_fields(show):
+    """FIELDS['shows'] for `show`: Show, ShowArchive or archive.all_shows()."""
+    return {
+        'id': show.id,
+        'start_time': show.start_time,
+        'duration': show.duration,
+        'venue_id': show.venue_id,
+        'venue_name': Venue.name.label('venue_name'),
+        'artiste_id': show.artiste_id,
+        'artiste_name': Artiste.name.label('artiste_name'),
+        'artiste_image_link': Artiste.image_link.label('artiste_image_link'),
+    }
+
+
+# resource -> field name -> column; only the requested columns are selected
+FIELDS = {
+    'venues': {
+        'id': Venue.id,
+        'name': Venue.name,
+        'city': Venue.city,
+        'state': Venue.state,
+        'address': Venue.address,
+        'phone': Venue.phone,
+        'genres': Venue.genres,
+        'area_id': Venue.area_id,
+        'image_link': Venue.image_link,
+        'facebook_link': Venue.facebook_link,
+        'website': Venue.website,
+        'seeking_talent': Venue.seeking_talent,
+        'seeking_description': Venue.seeking_description,
+        'upcoming_shows_count': Venue.upcoming_shows_count,
+        'past_shows_count': Venue.past_shows_count,
+        'next_show_time': Venue.next_show_time,
+    },
+    'artists': {
+        'id': Artiste.id,
+        'name': Artiste.name,
+        'city': Artiste.city,
+        'state': Artiste.state,
+        'phone': Artiste.phone,
+        'genres': Artiste.genres,
+        'area_id': Artiste.area_id,
+        'image_link': Artiste.image_link,
+        'facebook_link': Artiste.facebook_link,
+        'website': Artiste.website,
+        'seeking_venue': Artiste.seeking_venue,
+        'seeking_description': Artiste.seeking_description,
+        'upcoming_shows_count': Artiste.upcoming_shows_count,
+        'past_shows_count': Artiste.past_shows_count,
+        'next_show_time': Artiste.next_show_time,
+    },
+    'shows': show_fields(Show),
+}
+DEFAULT_FIELDS = {
+    'venues': ('id', 'name', 'city', 'state'),
+    'artists': ('id', 'name', 'city', 'state'),
+    'shows': ('id', 'start_time', 'venue_id', 'venue_name', 'artiste_id', 'artiste_name'),
+}
+# shows are ordered by (start_time, id) of the entity they are read from, see list_response
+LIST_KEYS = {
+    'venues': (Venue.name, Venue.id),
+    'artists': (Artiste.name, Artiste.id),
+}
+# ?sort=next_show: soonest upcoming show first, from the stored next_show_time;
+# rows with no upcoming show are left out
+SORT_KEYS = {
+    'venues': {'next_show': (Venue.next_show_time, Venue.id)},
+    'artists': {'next_show': (Artiste.next_show_time, Artiste.id)},
+}
+MODELS = {'venues': Venue, 'artists': Artiste, 'shows': Show}
+
+
+# ----------------------------------------------------------------------------#
+# Helpers.
+# ----------------------------------------------------------------------------#
+def encode_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(repr(value))
+
+
+def json_response(payload, status=200):
+    if orjson is not None:
+        body = orjson.dumps(payload)
+    else:
+        body = json.dumps(payload, separators=(',', ':'), default=encode_default)
+    return Response(body, status=status, mimetype='application/json')
+
+
+def error_response(message, status):
+    return json_response({'error': message}, status)
+
+
+def selected_fields(resource):
+    """Field names from ?fields=a,b; unknown names are a 400."""
+    requested = request.args.get('fields')
+    if not requested:
+        return DEFAULT_FIELDS[resource]
+    fields = tuple(field.strip() for field in requested.split(',') if field.strip())
+    unknown = [field for field in fields if field not in FIELDS[resource]]
+    if unknown:
+        abort(error_response('Unknown fields: ' + ', '.join(unknown), 400))
+    return fields
+
+
+def projection(resource, fields, extra=(), show=Show):
+    # extra columns (e.g. keyset keys) are selected after the requested fields;
+    # shows are read from `show`, see show_fields
+    columns = FIELDS[resource] if resource != 'shows' else show_fields(show)
+    query = db.session.query(*([columns[field] for field in fields] + list(extra)))
+    if resource == 'shows':
+        query = query.select_from(show) \
+            .join(Venue, show.venue_id == Venue.id) \
+            .join(Artiste, show.artiste_id == Artiste.id)
+    return query
+
+
+def serialize(rows, fields):
+    return [dict(zip(fields, row)) for row in rows]
+
+
+def list_response(resource, query_filter=None, show=Show):
+    fields = selected_fields(resource)
+    keys = (show.start_time, show.id) if resource == 'shows' else LIST_KEYS[resource]
+    sort = request.args.get('sort')
+    if sort:
+        keys = SORT_KEYS.get(resource, {}).get(sort)
+        if keys is None:
+            return error_response('Unknown sort: ' + sort, 400)
+    query = projection(resource, fields, extra=keys, show=show)
+    if sort:
+        query = query.filter(keys[0].isnot(None))
+    if query_filter is not None:
+        query = query_filter(query)
+    after = request.args.get('after')
+    before = request.args.get('before')
+    if (after and decode_cursor(after, keys) is None) or (before and decode_cursor(before, keys) is None):
+        return error_response('Invalid cursor', 400)
+    page = keyset_page(query, keys, after=after, before=before,
+                       per_page=parsed_arg('limit', int))
+    return json_response({'data': serialize(page['items'], fields),
+                          'next': page['next'],
+                          'prev': page['prev']})
+
+
+def detail_response(resource, item_id):
+    fields = selected_fields(resource)
+    row = projection(resource, fields).filter(MODELS[resource].id == item_id).first()
+    if row is None and resource == 'shows':
+        # archived shows keep their id
+        row = projection(resource, fields, show=ShowArchive).filter(ShowArchive.id == item_id).first()
+    if row is None:
+        return error_response('Not found', 404)
+    return json_response({'data': dict(zip(fields, row))})
+
+
+def search_response(resource, matches):
+    # matches are ranked [{'id', 'name'}]; fetch the requested fields for them in one query
+    fields = selected_fields(resource)
+    ids = [match['id'] for match in matches]
+    model = MODELS[resource]
+    rows = projection(resource, fields, extra=(model.id,)).filter(model.id.in_(ids)).all() if ids else []
+    by_id = dict((row[-1], row[:-1]) for row in rows)
+    return json_response({'data': serialize([by_id[i] for i in ids if i in by_id], fields)})
+
+
+def parsed_arg(name, parse, invalid=None):
+    """request.args[name] converted by `parse`, or None when absent; a malformed value is a 400.
+
+    Unlike request.args.get(name, type=...), a bad value is reported instead
+    of silently dropping the filter: by `invalid(message)` when given, which
+    must abort, else as a JSON error.
+    """
+    value = request.args.get(name, '')
+    if not value.strip():
+        return None
+    try:
+        return parse(value)
+    except (ValueError, OverflowError):
+        message = 'Invalid {}: {}'.format(name, value)
+        if invalid is not None:
+            invalid(message)
+        abort(error_response(message, 400))
+
+
+def list_filters(model):
+    # ?genre=Jazz&genre=Blues: rows having every listed genre; ?area=<id>: rows in that area;
+    # ?upcoming=1: rows with an upcoming show
+    def apply(query):
+        query = query.filter(*genre_criteria(model, selected_genres(request.args)))
+        area_id = parsed_arg('area', int)
+        if area_id is not None:
+            query = query.filter(model.area_id == area_id)
+        if request.args.get('upcoming') == '1':
+            query = query.filter(model.next_show_time.isnot(None))
+        return query
+    return apply
+
+
+def show_source():
+    """The entity /api/v1/shows and the exports read from: Show and ShowArchive when ?start= reaches the archive."""
+    return shows_from(parsed_arg('start', dateutil.parser.parse))
+
+
+def show_criteria(show=Show):
+    """Criteria on `show` for ?start=&end=&venue_id=&artist_id=, shared by /api/v1/shows and the exports."""
+    criteria = []
+    start = parsed_arg('start', dateutil.parser.parse)
+    end = parsed_arg('end', dateutil.parser.parse)
+    venue_id = parsed_arg('venue_id', int)
+    artist_id = parsed_arg('artist_id', int)
+    if start is not None:
+        criteria.append(show.start_time >= start)
+    if end is not None:
+        criteria.append(show.start_time < end)
+    if venue_id is not None:
+        criteria.append(show.venue_id == venue_id)
+    if artist_id is not None:
+        criteria.append(show.artiste_id == artist_id)
+    return criteria
+
+
+def show_filters(show):
+    return lambda query: query.filter(*show_criteria(show))
+
+
+# ----------------------------------------------------------------------------#
+# Endpoints.
+# ----------------------------------------------------------------------------#
+@api.route('/areas')
+def list_areas():
+    rows = db.session.query(Area.id, Area.city, Area.state, Area.venues_count) \
+        .filter(Area.venues_count > 0) \
+        .order_by(Area.state, Area.city)
+    return json_response({'data': serialize(rows, ('id', 'city', 'state', 'venues_count'))})
+
+
+@api.route('/venues')
+def list_venues():
+    return list_response('venues', list_filters(Venue))
+
+
+@api.route('/venues/<int:venue_id>')
+def get_venue(venue_id):
+    return detail_response('venues', venue_id)
+
+
+@api.route('/venues/search')
+def search_venues():
+    matches = search.search_venues(request.args.get('q', ''), parsed_arg('limit', int))
+    return search_response('venues', matches)
+
+
+@api.route('/venues/available')
+def available_venues():
+    # ?city=&state=&genre=&start=&end=: venues with no show overlapping [start, end)
+    city = request.args.get('city', '')
+    state = request.args.get('state', '')
+    genre = request.args.get('genre') or None
+    start = parsed_arg('start', dateutil.parser.parse)
+    end = parsed_arg('end', dateutil.parser.parse)
+    if not city.strip() or not state.strip() or start is None or end is None or end <= start:
+        return error_response('city, state, start and end are required, with start before end', 400)
+    if genre is not None and genre not in dict(GENRE_CHOICES):
+        return error_response('Unknown genre: ' + genre, 400)
+    ids = free_venue_ids(city, state, genre, start, end)
+    return search_response('venues', [{'id': venue_id} for venue_id in ids])
+
+
+@api.route('/artists')
+def list_artists():
+    return list_response('artists', list_filters(Artiste))
+
+
+@api.route('/artists/<int:artist_id>')
+def get_artist(artist_id):
+    return detail_response('artists', artist_id)
+
+
+@api.route('/artists/search')
+def search_artists():
+    matches = search.search_artists(request.args.get('q', ''), parsed_arg('limit', int))
+    return search_response('artists', matches)
+
+
+@api.route('/shows')
+def list_shows():
+    show = show_source()
+    return list_response('shows', show_filters(show), show)
+
+
+@api.route('/shows/<int:show_id>')
+def get_show(show_id):
+    return detail_response('shows', show_id)
+
+
+@api.route('/shows/search')
+def search_shows():
+    # shows whose venue or artist matches q, narrowed by the same filters as /shows
+    term = request.args.get('q', '')
+    venue_ids = [match['id'] for match in search.search_venues(term)]
+    artist_ids = [match['id'] for match in search.search_artists(term)]
+    if not venue_ids and not artist_ids:
+        return json_response({'data': [], 'next': None, 'prev': None})
+    show = show_source()
+    return list_response('shows', lambda query: query.filter(*show_criteria(show)).filter(
+        db.or_(show.venue_id.in_(venue_ids), show.artiste_id.in_(artist_ids))), show)
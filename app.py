@@ -3,14 +3,39 @@
 # ----------------------------------------------------------------------------#
 import dateutil.parser
 import babel
-from flask import Flask, render_template, request, flash, redirect, url_for
+import babel.dates
+from functools import lru_cache
+from flask import Flask, render_template, request, flash, redirect, url_for, abort, jsonify, Response, \
+    stream_with_context
 from flask_moment import Moment
 from flask_migrate import Migrate
+import click
+import csv
+import io
+import json
 import logging
 from logging import Formatter, FileHandler
 from forms import *
 from models import *
+from pagination import keyset_page, keyset_query, PAGE_SIZE
+from query_plans import check_query_plans
+import bulk_import
+import replica
+from archive import archive_past_shows, PastShows
+from scheduling import schedule_shows
+from api import api, parsed_arg, show_criteria, show_source
+from db_pool import engine_options, set_transaction_timeout, pool_status
+from instrumentation import RequestMetrics
+import search
+from typeahead import PrefixIndex, TYPEAHEAD_LIMIT
+from genres import selected_genres, genre_criteria, genre_facets, facet_links
+from response_cache import ResponseCache, cached_page, add_cache_tags, expire_cached_page_at
+from assets import Assets, build_assets
+import template_cache
+from itertools import groupby
 import sys
+import time
+from datetime import datetime, timedelta
 
 # ----------------------------------------------------------------------------#
 # App Config.
@@ -18,30 +43,307 @@ import sys
 app = Flask(__name__)
 moment = Moment(app)
 app.config.from_object('config')
+app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config))
+if app.config['DB_POOLER_MODE'] == 'transaction' and app.config['DB_STATEMENT_TIMEOUT']:
+    set_transaction_timeout(app.config['DB_STATEMENT_TIMEOUT'])
 
 db.init_app(app)
+replica.init_app(app, db)
 
 migrate = Migrate(app, db)
 
+metrics = RequestMetrics(app)
+
+page_cache = ResponseCache(app.config['PAGE_CACHE_BYTES'], app.config['PAGE_CACHE_MAX_AGE'])
+
+app.register_blueprint(api)
+
+assets = Assets(app)
+
+template_cache.init_app(app)
+
+
 
 # ----------------------------------------------------------------------------#
 # Filters.
 # ----------------------------------------------------------------------------#
+DATETIME_FORMATS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma",
+}
+DATETIME_LOCALE = babel.Locale.parse('en')
+
+
+@lru_cache(maxsize=None)
+def datetime_pattern(format_type):
+    # parsed once per format instead of on every babel.dates.format_datetime call
+    return babel.dates.parse_pattern(DATETIME_FORMATS.get(format_type, format_type))
+
+
+@lru_cache(maxsize=8192)
 def format_datetime(value, format_type='medium'):
     if isinstance(value, str):
         date = dateutil.parser.parse(value)
     else:
         date = value
-    if format_type == 'full':
-        format_type = "EEEE MMMM, d, y 'at' h:mma"
-    elif format_type == 'medium':
-        format_type = "EE MM, dd, y h:mma"
-    return babel.dates.format_datetime(date, format_type, locale='en')
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=babel.dates.UTC)
+    return datetime_pattern(format_type).apply(date, DATETIME_LOCALE)
+
+
+def format_datetimes(values, format_type='medium'):
+    # formats a whole result set, each distinct timestamp only once
+    formatted = {}
+    for value in values:
+        if value not in formatted:
+            formatted[value] = format_datetime(value, format_type)
+    return [formatted[value] for value in values]
 
 
 app.jinja_env.filters['datetime'] = format_datetime
 
 
+# ----------------------------------------------------------------------------#
+# Helpers.
+# ----------------------------------------------------------------------------#
+def partition_shows(shows, now=None):
+    # split shows into (upcoming, past) against a single timestamp
+    if now is None:
+        now = datetime.now()
+    upcoming = []
+    past = []
+    for show in shows:
+        if show['start_time'] >= now:
+            upcoming.append(show)
+        else:
+            past.append(show)
+    return upcoming, past
+
+
+def page_arg(name, parse):
+    # parsed_arg for the HTML pages: a malformed value gets the 400 page instead of a JSON error
+    return parsed_arg(name, parse, lambda message: abort(400, message))
+
+
+def match_count(model, criteria, results, limit):
+    # a page of search results that stops short of the limit already holds every match
+    if len(results) < search.page_limit(limit):
+        return len(results)
+    return db.session.query(db.func.count(model.id)).filter(*criteria).scalar()
+
+
+def area_criteria(model, area_id):
+    # ?area=<Area.id>; reads ix_<table>_area_id instead of matching city/state text
+    return [model.area_id == area_id] if area_id is not None else []
+
+
+def upcoming_criteria(model, upcoming):
+    # ?upcoming=1: only rows with an upcoming show, from the stored next_show_time
+    return [model.next_show_time.isnot(None)] if upcoming else []
+
+
+def show_counts(owner, upcoming_shows, now):
+    """(upcoming, past) show counts of a Venue or Artiste, from its stored counters.
+
+    Shows that started since the last `flask roll-shows` are still counted as
+    upcoming there; they are moved over using the upcoming shows just loaded.
+    """
+    upcoming, past = owner.upcoming_shows_count, owner.past_shows_count
+    if owner.next_show_time is not None and owner.next_show_time < now:
+        past += upcoming - len(upcoming_shows)
+        upcoming = len(upcoming_shows)
+    return upcoming, past
+
+
+# ----------------------------------------------------------------------------#
+# Queries.
+# ----------------------------------------------------------------------------#
+ARTIST_LIST_KEYS = (Artiste.name, Artiste.id)
+SHOW_LIST_KEYS = (Show.start_time, Show.id)
+
+
+def area_query():
+    return db.session.query(Area.id.label('area_id'), Area.city, Area.state, Venue.id, Venue.name) \
+        .join(Venue, Venue.area_id == Area.id) \
+        .order_by(Area.state, Area.city, Venue.id)
+
+
+def venue_detail_query(venue_id):
+    return db.session.query(Venue,
+                            Show.start_time,
+                            Artiste.id.label('artiste_id'),
+                            Artiste.name.label('artiste_name'),
+                            Artiste.image_link.label('artiste_image_link'),
+                            Artiste.version.label('artiste_version')) \
+        .outerjoin(Show, Show.venue_id == Venue.id) \
+        .outerjoin(Artiste, Show.artiste_id == Artiste.id) \
+        .filter(Venue.id == venue_id) \
+        .order_by(Show.start_time)
+
+
+def artist_detail_query(artist_id):
+    return db.session.query(Artiste,
+                            Show.start_time,
+                            Venue.id.label('venue_id'),
+                            Venue.name.label('venue_name'),
+                            Venue.image_link.label('venue_image_link'),
+                            Venue.version.label('venue_version')) \
+        .outerjoin(Show, Show.artiste_id == Artiste.id) \
+        .outerjoin(Venue, Show.venue_id == Venue.id) \
+        .filter(Artiste.id == artist_id) \
+        .order_by(Show.start_time)
+
+
+def venue_archive_query(venue_id):
+    return db.session.query(ShowArchive.start_time,
+                            Artiste.id.label('artiste_id'),
+                            Artiste.name.label('artiste_name'),
+                            Artiste.image_link.label('artiste_image_link'),
+                            Artiste.version.label('artiste_version')) \
+        .join(Artiste, ShowArchive.artiste_id == Artiste.id) \
+        .filter(ShowArchive.venue_id == venue_id)
+
+
+def artist_archive_query(artist_id):
+    return db.session.query(ShowArchive.start_time,
+                            Venue.id.label('venue_id'),
+                            Venue.name.label('venue_name'),
+                            Venue.image_link.label('venue_image_link'),
+                            Venue.version.label('venue_version')) \
+        .join(Venue, ShowArchive.venue_id == Venue.id) \
+        .filter(ShowArchive.artiste_id == artist_id)
+
+
+def venue_page_queries(venue_id):
+    return venue_detail_query(venue_id), venue_archive_query(venue_id).order_by(ShowArchive.start_time)
+
+
+def artist_page_queries(artist_id):
+    return artist_detail_query(artist_id), artist_archive_query(artist_id).order_by(ShowArchive.start_time)
+
+
+# endpoint -> the independent queries of its page; asgi.py runs them concurrently
+# on the event loop and hands the rows to the view under PREFETCHED_ROWS
+PAGE_QUERIES = {'show_venue': venue_page_queries, 'show_artist': artist_page_queries}
+PREFETCHED_ROWS = 'fyyur.prefetched_rows'
+
+
+def artist_list_query():
+    return db.session.query(Artiste.id, Artiste.name, Artiste.upcoming_shows_count)
+
+
+def show_list_query(show=Show):
+    # `show` may also be archive.all_shows(), for the exports
+    return db.session.query(show.id,
+                            show.start_time,
+                            Venue.id.label('venue_id'),
+                            Venue.name.label('venue_name'),
+                            Venue.version.label('venue_version'),
+                            Artiste.id.label('artiste_id'),
+                            Artiste.name.label('artiste_name'),
+                            Artiste.image_link.label('artiste_image_link'),
+                            Artiste.version.label('artiste_version')) \
+        .select_from(show) \
+        .join(Venue, show.venue_id == Venue.id) \
+        .join(Artiste, show.artiste_id == Artiste.id)
+
+
+# ----------------------------------------------------------------------------#
+# Caches.
+# ----------------------------------------------------------------------------#
+def index_expired(built_at):
+    # in-process indexes only see this process's writes, so like cached pages they are
+    # rebuilt after PAGE_CACHE_MAX_AGE seconds to pick up other workers' and CLI writes
+    max_age = app.config['PAGE_CACHE_MAX_AGE']
+    return bool(max_age) and built_at + max_age <= time.time()
+
+
+# area -> venues listing used by /venues; rebuilt lazily after a venue write
+area_index = None
+area_index_built = 0.0
+
+
+def build_area_index():
+    return group_areas(area_query())
+
+
+def group_areas(rows):
+    # rows ordered by state, city
+    data = []
+    for (area_id, city, state), areaVenues in groupby(rows, key=lambda row: (row.area_id, row.city, row.state)):
+        data.append({
+            "id": area_id,
+            "city": city,
+            "state": state,
+            "venues": [{"id": venue.id, "name": venue.name} for venue in areaVenues]
+        })
+
+    return data
+
+
+def get_area_index():
+    global area_index, area_index_built
+    if area_index is None or index_expired(area_index_built):
+        area_index_built = time.time()
+        area_index = build_area_index()
+    return area_index
+
+
+def invalidate_area_index():
+    global area_index
+    area_index = None
+
+
+# lowercase venue/artist names for /api/typeahead, updated in place on writes
+name_index = None
+name_index_built = 0.0
+
+
+def get_name_index():
+    global name_index, name_index_built
+    if name_index is None or index_expired(name_index_built):
+        name_index_built = time.time()
+        index = PrefixIndex()
+        for row in db.session.query(Venue.id, Venue.name):
+            index.add('venue', row.id, row.name)
+        for row in db.session.query(Artiste.id, Artiste.name):
+            index.add('artist', row.id, row.name)
+        name_index = index
+    return name_index
+
+
+def clear_fragments():
+    # fragment keys hold (id, version); after a delete that pair could come back
+    # for a new row, e.g. in a SQLite database created before ids stopped being reused
+    if app.jinja_env.fragment_cache is not None:
+        app.jinja_env.fragment_cache.clear()
+
+
+# called after a successful commit; `name` is None when the row was deleted
+def venues_changed(venue_id, name=None):
+    page_cache.invalidate('venues', 'venue:%d' % venue_id)
+    if name is None:
+        clear_fragments()
+    invalidate_area_index()
+    search.invalidate_search_index(Venue)
+    if name_index is not None:
+        name_index.add('venue', venue_id, name)
+
+
+def artists_changed(artist_id, name=None):
+    page_cache.invalidate('artists', 'artist:%d' % artist_id)
+    if name is None:
+        clear_fragments()
+    search.invalidate_search_index(Artiste)
+    if name_index is not None:
+        name_index.add('artist', artist_id, name)
+
+
+def shows_changed(venue_id, artist_id):
+    # the lists show and filter on the stored upcoming show counts
+    page_cache.invalidate('shows', 'venues', 'artists', 'venue:%d' % venue_id, 'artist:%d' % artist_id)
+
+
 # ----------------------------------------------------------------------------#
 # Controllers.
 # ----------------------------------------------------------------------------#
@@ -82,12 +384,11 @@ def create_venue_submission():
             newVenue.seeking_talent = False
         db.session.add(newVenue)
         db.session.commit()
+        venues_changed(newVenue.id, newVenue.name)
     except():
         db.session.rollback()
         error = True
         print(sys.exc_info)
-    finally:
-        db.session.close()
     if not error:
         # on successful db insert, flash success
         flash('Venue ' + request.form['name'] + ' was successfully listed!')
@@ -101,46 +402,57 @@ def create_venue_submission():
 #  Read
 #  ----------
 @app.route('/venues')
+@cached_page(page_cache, 'venues')
 def venues():
-    allVenues = db.session.query(Venue.city, Venue.state).distinct().all()
-
-    data = []
+    genres = selected_genres(request.args)
+    area = page_arg('area', int)
+    upcoming = request.args.get('upcoming') == '1'
+    criteria = genre_criteria(Venue, genres) + area_criteria(Venue, area) + upcoming_criteria(Venue, upcoming)
+    areas = group_areas(area_query().filter(*criteria)) if criteria else get_area_index()
+    facets = facet_links('venues', genre_facets(Venue, *criteria), genres, area=area,
+                         upcoming=1 if upcoming else None)
 
-    for area in allVenues:
+    return render_template('pages/venues.html', areas=areas, facets=facets, genres=genres, area=area,
+                           upcoming=upcoming)
 
-        areaVenues = Venue.query.filter_by(state=area.state, city=area.city).all()
 
-        venue_data = []
-        for venue in areaVenues:
-            venue_data.append({
-                "id": venue.id,
-                "name": venue.name,
-            })
-
-        data.append({
-            "city": area.city,
-            "state": area.state,
-            "venues": venue_data
-        })
-
-    return render_template('pages/venues.html', areas=data)
-
-
-@app.route('/venues/search', methods=['POST'])
+@app.route('/venues/search', methods=['GET', 'POST'])
+@cached_page(page_cache, 'venues')
 def search_venues():
-    search_term = request.form.get('search_term', '')
-    responseData = Venue.query.filter(Venue.name.ilike('%' + search_term + '%')).all()
-    response = {'count': len(responseData), 'data': responseData}
+    search_term = request.values.get('search_term', '')
+    genres = selected_genres(request.values)
+    limit = page_arg('limit', int)
+    responseData = search.search_venues(search_term, limit, genres)
+    # facet counts and the count cover every match, not only the page of results shown
+    criteria = search.match_criteria(Venue, search_term, genres)
+    counts = genre_facets(Venue, *criteria) if responseData else {}
+    facets = facet_links('search_venues', counts, genres, search_term=search_term)
+    response = {'count': match_count(Venue, criteria, responseData, limit), 'data': responseData}
 
     return render_template('pages/search_venues.html', results=response,
-                           search_term=request.form.get('search_term', ''))
+                           search_term=search_term, facets=facets)
 
 
 @app.route('/venues/<int:venue_id>')
+@cached_page(page_cache)
 def show_venue(venue_id):
-    realData = Venue.query.get(venue_id)
+    prefetched = request.environ.get(PREFETCHED_ROWS)
+    if prefetched is not None:
+        rows, archived = prefetched
+        return render_venue(venue_id, rows, lambda: archived)
+    detail_query, archive_query = venue_page_queries(venue_id)
+    return render_venue(venue_id, detail_query.all(), archive_query.all)
+
+
+def render_venue(venue_id, rows, archived_rows):
+    if not rows:
+        abort(404)
+
+    realData = rows[0].Venue
     data = {'id': realData.id,
             'name': realData.name,
+            'city': realData.city,
+            'state': realData.state,
             'address': realData.address,
             'phone': realData.phone,
             'genres': realData.genres,
@@ -149,22 +461,28 @@ def show_venue(venue_id):
             'seeking_talent': realData.seeking_talent,
             'seeking_description': realData.seeking_description,
             'image_link': realData.image_link,
-            'upcoming_shows': Show.query.join(Artiste, Show.artiste_id == Artiste.id).add_columns(
-                Show.venue_id,
-                Artiste.id.label('artiste_id'),
-                Artiste.name.label('artiste_name'),
-                Artiste.image_link.label('artiste_image_link'),
-                Show.start_time
-            ).filter(Show.start_time >= datetime.now(), Show.venue_id == venue_id),
-            'past_shows': Show.query.join(Artiste, Show.artiste_id == Artiste.id).add_columns(
-                Show.venue_id,
-                Artiste.id.label('artiste_id'),
-                Artiste.name.label('artiste_name'),
-                Artiste.image_link.label('artiste_image_link'),
-                Show.start_time
-            ).filter(Show.start_time < datetime.now(), Show.venue_id == venue_id)}
-    data['upcoming_shows_count'] = data['upcoming_shows'].count()
-    data['past_shows_count'] = data['past_shows'].count()
+            'version': realData.version}
+
+    def to_show(row):
+        add_cache_tags('artist:%d' % row.artiste_id)
+        return {'venue_id': venue_id,
+                'artiste_id': row.artiste_id,
+                'artiste_name': row.artiste_name,
+                'artiste_image_link': row.artiste_image_link,
+                'artiste_version': row.artiste_version,
+                'start_time': row.start_time,
+                'start_time_full': format_datetime(row.start_time, 'full')}
+
+    now = datetime.now()
+    data['upcoming_shows'], recentShows = partition_shows(
+        (to_show(row) for row in rows if row.start_time is not None), now)
+    data['upcoming_shows_count'], data['past_shows_count'] = show_counts(realData, data['upcoming_shows'], now)
+    # archived past shows are only loaded if the template renders them
+    data['past_shows'] = PastShows(recentShows, archived_rows, to_show)
+
+    add_cache_tags('venue:%d' % venue_id)
+    if data['upcoming_shows']:
+        expire_cached_page_at(data['upcoming_shows'][0]['start_time'])
 
     return render_template('pages/show_venue.html', venue=data)
 
@@ -172,47 +490,37 @@ def show_venue(venue_id):
 #  Update
 #  ----------
 @app.route('/venues/<int:venue_id>/edit', methods=['GET'])
+@replica.primary_only
 def edit_venue(venue_id):
-    form = VenueForm()
-    venue = Venue.query.get(venue_id)
+    venue = Venue.query.get_or_404(venue_id)
+    form = VenueForm(obj=venue, website_link=venue.website)
 
     return render_template('forms/edit_venue.html', form=form, venue=venue)
 
 
 @app.route('/venues/<int:venue_id>/edit', methods=['POST'])
 def edit_venue_submission(venue_id):
-    error = False
-    try:
-        venue = Venue.query.get(venue_id)
-        venue.name = request.form.to_dict()['name'],
-        venue.city = request.form.to_dict()['city']
-        venue.state = request.form.to_dict()['state']
-        venue.address = request.form.to_dict()['address']
-        venue.phone = request.form.to_dict()['phone']
-        venue.genres = request.form.to_dict()['genres']
-        venue.facebook_link = request.form.to_dict()['facebook_link']
-        venue.image_link = request.form.to_dict()['image_link']
-        venue.website = request.form.to_dict()['website_link']
-        venue.seeking_talent = request.form.to_dict()['seeking_talent']
-        venue.seeking_description = request.form.to_dict()['seeking_description']
-        if venue.seeking_talent == 'y':
-            venue.seeking_talent = True
-        else:
-            venue.seeking_talent = False
-        db.session.add(venue)
-        db.session.commit()
-    except():
+    # the templates carry no CSRF token, as with the create forms
+    form = VenueForm(meta={'csrf': False})
+    version = request.form.get('version', type=int)
+    if not form.validate() or version is None:
+        flash('Venue could not be updated. Please correct the errors below.')
+        return render_template('forms/edit_venue.html', form=form,
+                               venue={'id': venue_id, 'name': form.name.data, 'version': version}), 400
+
+    # a single UPDATE ... WHERE id AND version; no row is loaded first
+    values = model_values(form)
+    values['area_id'] = area_id_for(db.session.connection(), values['city'], values['state'])
+    if update_venue_versioned(venue_id, version, values) is None:
         db.session.rollback()
-        error = True
-        print(sys.exc_info)
-    finally:
-        db.session.close()
-    if not error:
-        # on successful db insert, flash success
-        flash('Venue ' + request.form['name'] + ' was successfully updated!')
-    else:
-        # on unsuccessful db insert, flash error.
-        flash('An error occurred. Venue ' + request.form['name'] + ' could not be updated.')
+        if db.session.query(Venue.id).filter(Venue.id == venue_id).first() is None:
+            abort(404)
+        flash('Venue ' + form.name.data + ' was changed by someone else while you were editing it. '
+              'Please review the current details and try again.')
+        return redirect(url_for('edit_venue', venue_id=venue_id))
+    db.session.commit()
+    venues_changed(venue_id, form.name.data)
+    flash('Venue ' + form.name.data + ' was successfully updated!')
 
     return redirect(url_for('show_venue', venue_id=venue_id))
 
@@ -220,6 +528,7 @@ def edit_venue_submission(venue_id):
 #  Delete
 #  ----------
 @app.route('/venues/<venue_id>/delete')
+@replica.primary_only
 def delete_venue(venue_id):
     error = False
     try:
@@ -229,13 +538,12 @@ def delete_venue(venue_id):
         else:
             db.session.delete(deleteVenue)
             db.session.commit()
+            venues_changed(deleteVenue.id)
 
     except():
         db.session.rollback()
         error = True
         print(sys.exc_info)
-    finally:
-        db.session.close()
     if not error:
         # on successful db delete, flash success
         flash('Venue was successfully deleted!')
@@ -275,12 +583,11 @@ def create_artist_submission():
             newArtiste.seeking_venue = False
         db.session.add(newArtiste)
         db.session.commit()
+        artists_changed(newArtiste.id, newArtiste.name)
     except():
         db.session.rollback()
         error = True
         print(sys.exc_info)
-    finally:
-        db.session.close()
     if not error:
         # on successful db insert, flash success
         flash('Artiste ' + request.form['name'] + ' was successfully listed!')
@@ -294,28 +601,58 @@ def create_artist_submission():
 #  Read
 #  ----------
 @app.route('/artists')
+@cached_page(page_cache, 'artists')
 def artists():
-    data = Artiste.query.all()
+    genres = selected_genres(request.args)
+    area = page_arg('area', int)
+    upcoming = request.args.get('upcoming') == '1'
+    criteria = genre_criteria(Artiste, genres) + area_criteria(Artiste, area) + upcoming_criteria(Artiste, upcoming)
+    page = keyset_page(artist_list_query().filter(*criteria), ARTIST_LIST_KEYS,
+                       after=request.args.get('after'), before=request.args.get('before'))
+    facets = facet_links('artists', genre_facets(Artiste, *criteria), genres, area=area,
+                         upcoming=1 if upcoming else None)
 
-    return render_template('pages/artists.html', artists=data)
+    return render_template('pages/artists.html', artists=page['items'], page=page, genres=genres, area=area,
+                           upcoming=upcoming, facets=facets)
 
 
-@app.route('/artists/search', methods=['POST'])
+@app.route('/artists/search', methods=['GET', 'POST'])
+@cached_page(page_cache, 'artists')
 def search_artists():
-    search_term = request.form.get('search_term', '')
-    responseData = Artiste.query.add_columns(Artiste.id, Artiste.name).filter(
-        Artiste.name.ilike('%' + search_term + '%')).all()
-    response = {'count': len(responseData), 'data': responseData}
+    search_term = request.values.get('search_term', '')
+    genres = selected_genres(request.values)
+    limit = page_arg('limit', int)
+    responseData = search.search_artists(search_term, limit, genres)
+    # facet counts and the count cover every match, not only the page of results shown
+    criteria = search.match_criteria(Artiste, search_term, genres)
+    counts = genre_facets(Artiste, *criteria) if responseData else {}
+    facets = facet_links('search_artists', counts, genres, search_term=search_term)
+    response = {'count': match_count(Artiste, criteria, responseData, limit), 'data': responseData}
 
     return render_template('pages/search_artists.html', results=response,
-                           search_term=request.form.get('search_term', ''))
+                           search_term=search_term, facets=facets)
 
 
 @app.route('/artists/<int:artist_id>')
+@cached_page(page_cache)
 def show_artist(artist_id):
-    realData = Artiste.query.get(artist_id)
+    prefetched = request.environ.get(PREFETCHED_ROWS)
+    if prefetched is not None:
+        rows, archived = prefetched
+        return render_artist(artist_id, rows, lambda: archived)
+    detail_query, archive_query = artist_page_queries(artist_id)
+    return render_artist(artist_id, detail_query.all(), archive_query.all)
+
+
+def render_artist(artist_id, rows, archived_rows):
+    if not rows:
+        abort(404)
+
+    realData = rows[0].Artiste
     data = {'id': realData.id,
             'name': realData.name,
+            'city': realData.city,
+            'state': realData.state,
             'phone': realData.phone,
             'website': realData.website,
             'genres': realData.genres,
@@ -323,22 +660,28 @@ def show_artist(artist_id):
             'seeking_venue': realData.seeking_venue,
             'seeking_description': realData.seeking_description,
             'image_link': realData.image_link,
-            'upcoming_shows': Show.query.join(Venue, Show.venue_id == Venue.id).add_columns(
-                Show.artiste_id,
-                Venue.id.label('venue_id'),
-                Venue.name.label('venue_name'),
-                Venue.image_link.label('venue_image_link'),
-                Show.start_time
-            ).filter(Show.start_time >= datetime.now(), Show.artiste_id == artist_id),
-            'past_shows': Show.query.join(Venue, Show.venue_id == Venue.id).add_columns(
-                Show.artiste_id,
-                Venue.id.label('venue_id'),
-                Venue.name.label('venue_name'),
-                Venue.image_link.label('venue_image_link'),
-                Show.start_time
-            ).filter(Show.start_time < datetime.now(), Show.artiste_id == artist_id)}
-    data['upcoming_shows_count'] = data['upcoming_shows'].count()
-    data['past_shows_count'] = data['past_shows'].count()
+            'version': realData.version}
+
+    def to_show(row):
+        add_cache_tags('venue:%d' % row.venue_id)
+        return {'artiste_id': artist_id,
+                'venue_id': row.venue_id,
+                'venue_name': row.venue_name,
+                'venue_image_link': row.venue_image_link,
+                'venue_version': row.venue_version,
+                'start_time': row.start_time,
+                'start_time_full': format_datetime(row.start_time, 'full')}
+
+    now = datetime.now()
+    data['upcoming_shows'], recentShows = partition_shows(
+        (to_show(row) for row in rows if row.start_time is not None), now)
+    data['upcoming_shows_count'], data['past_shows_count'] = show_counts(realData, data['upcoming_shows'], now)
+    # archived past shows are only loaded if the template renders them
+    data['past_shows'] = PastShows(recentShows, archived_rows, to_show)
+
+    add_cache_tags('artist:%d' % artist_id)
+    if data['upcoming_shows']:
+        expire_cached_page_at(data['upcoming_shows'][0]['start_time'])
 
     return render_template('pages/show_artist.html', artist=data)
 
@@ -346,46 +689,37 @@ def show_artist(artist_id):
 #  Update
 #  ----------
 @app.route('/artists/<int:artist_id>/edit', methods=['GET'])
+@replica.primary_only
 def edit_artist(artist_id):
-    form = ArtistForm()
-    artiste = Artiste.query.get(artist_id)
+    artiste = Artiste.query.get_or_404(artist_id)
+    form = ArtistForm(obj=artiste, website_link=artiste.website)
 
     return render_template('forms/edit_artist.html', form=form, artist=artiste)
 
 
 @app.route('/artists/<int:artist_id>/edit', methods=['POST'])
 def edit_artist_submission(artist_id):
-    error = False
-    try:
-        artiste = Artiste.query.get(artist_id)
-        artiste.name = request.form.to_dict()['name']
-        artiste.city = request.form.to_dict()['city']
-        artiste.state = request.form.to_dict()['state']
-        artiste.phone = request.form.to_dict()['phone']
-        artiste.genres = request.form.to_dict()['genres']
-        artiste.facebook_link = request.form.to_dict()['facebook_link']
-        artiste.image_link = request.form.to_dict()['image_link']
-        artiste.website = request.form.to_dict()['website_link']
-        artiste.seeking_venue = request.form.to_dict()['seeking_venue']
-        artiste.seeking_description = request.form.to_dict()['seeking_description']
-        if artiste.seeking_venue == 'y':
-            artiste.seeking_venue = True
-        else:
-            artiste.seeking_venue = False
-        db.session.add(artiste)
-        db.session.commit()
-    except():
+    # the templates carry no CSRF token, as with the create forms
+    form = ArtistForm(meta={'csrf': False})
+    version = request.form.get('version', type=int)
+    if not form.validate() or version is None:
+        flash('Artiste could not be edited. Please correct the errors below.')
+        return render_template('forms/edit_artist.html', form=form,
+                               artist={'id': artist_id, 'name': form.name.data, 'version': version}), 400
+
+    # a single UPDATE ... WHERE id AND version; no row is loaded first
+    values = model_values(form)
+    values['area_id'] = area_id_for(db.session.connection(), values['city'], values['state'])
+    if update_versioned(Artiste, artist_id, version, values) is None:
         db.session.rollback()
-        error = True
-        print(sys.exc_info)
-    finally:
-        db.session.close()
-    if not error:
-        # on successful db insert, flash success
-        flash('Artiste ' + request.form['name'] + ' was successfully edited')
-    else:
-        # on unsuccessful db insert, flash error.
-        flash('An error occurred. Artiste ' + request.form['name'] + ' could not be edited.')
+        if db.session.query(Artiste.id).filter(Artiste.id == artist_id).first() is None:
+            abort(404)
+        flash('Artiste ' + form.name.data + ' was changed by someone else while you were editing it. '
+              'Please review the current details and try again.')
+        return redirect(url_for('edit_artist', artist_id=artist_id))
+    db.session.commit()
+    artists_changed(artist_id, form.name.data)
+    flash('Artiste ' + form.name.data + ' was successfully edited')
 
     return redirect(url_for('show_artist', artist_id=artist_id))
 
@@ -406,45 +740,46 @@ def create_shows():
 
 @app.route('/shows/create', methods=['POST'])
 def create_show_submission():
-    error = False
-    try:
-        newShow = Show(artiste_id=request.form.to_dict()['artiste_id'],
-                       venue_id=request.form.to_dict()['venue_id'],
-                       start_time=request.form.to_dict()['start_time'])
-        db.session.add(newShow)
-        db.session.commit()
-    except():
-        db.session.rollback()
-        error = True
-        print(sys.exc_info)
-    finally:
-        db.session.close()
-    if not error:
+    ids, errors = schedule_shows([request.form.to_dict()])
+    if ids:
+        shows_changed(int(request.form['venue_id']), int(request.form['artiste_id']))
         # on successful db insert, flash success
         flash('Show was successfully listed!')
     else:
-        # on unsuccessful db insert, flash error.
-        flash('An error occurred. Show could not be listed.')
+        # on invalid input or a double booking, flash the reasons instead.
+        flash('An error occurred. Show could not be listed: ' + '; '.join(
+            message for error in errors for messages in error['errors'].values() for message in messages))
 
     return render_template('pages/home.html')
 
 
+@app.route('/shows/batch', methods=['POST'])
+def create_shows_batch():
+    # a whole tour at once: {"shows": [{"artiste_id", "venue_id", "start_time", "duration"}, ...]}
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict) or not isinstance(payload.get('shows'), list):
+        return jsonify(error='Expected a JSON body {"shows": [...]}'), 400
+    ids, errors = schedule_shows(payload['shows'])
+    if errors:
+        return jsonify(errors=errors), 422
+    for venue_id, artist_id in set((int(show['venue_id']), int(show['artiste_id'])) for show in payload['shows']):
+        shows_changed(venue_id, artist_id)
+    return jsonify(ids=ids), 201
+
+
 #  Read
 #  ----------
 @app.route('/shows')
+@cached_page(page_cache, 'shows')
 def shows():
-    data = Show.query \
-        .join(Venue, Show.venue_id == Venue.id) \
-        .join(Artiste, Show.artiste_id == Artiste.id) \
-        .add_columns(Venue.name.label('venue_name'),
-                     Artiste.name.label('artiste_name'),
-                     Artiste.image_link.label('artiste_image_link'),
-                     Venue.id.label('venue_id'),
-                     Artiste.id.label('artiste_id'),
-                     Show.start_time) \
-        .all()
+    page = keyset_page(show_list_query(), SHOW_LIST_KEYS,
+                       after=request.args.get('after'), before=request.args.get('before'))
+    add_cache_tags(*['venue:%d' % row.venue_id for row in page['items']])
+    add_cache_tags(*['artist:%d' % row.artiste_id for row in page['items']])
+
+    start_times = format_datetimes([row.start_time for row in page['items']], 'full')
 
-    return render_template('pages/shows.html', shows=data)
+    return render_template('pages/shows.html', shows=page['items'], start_times=start_times, page=page)
 
 
 #  Update
@@ -455,9 +790,93 @@ def shows():
 #  ----------
 
 
+#  Export
+#  ----------
+EXPORT_COLUMNS = ('id', 'start_time', 'venue_id', 'venue_name', 'artiste_id', 'artiste_name', 'artiste_image_link')
+EXPORT_BATCH_SIZE = 1000
+
+
+def export_query():
+    # the filters are parsed here, before streaming starts, so a bad value can still be a 400;
+    # archived shows are included when ?start= reaches them
+    show = show_source()
+    query = show_list_query(show).filter(*show_criteria(show))
+    # server-side cursor: rows are fetched from the database in batches as they are written out
+    return query.order_by(show.start_time, show.id) \
+        .execution_options(stream_results=True) \
+        .yield_per(EXPORT_BATCH_SIZE)
+
+
+def export_values(row):
+    return [getattr(row, column) for column in EXPORT_COLUMNS]
+
+
+@app.route('/export/shows.ndjson')
+def export_shows_ndjson():
+    rows = export_query()
+
+    def generate():
+        for row in rows:
+            record = dict(zip(EXPORT_COLUMNS, export_values(row)))
+            record['start_time'] = record['start_time'].isoformat() if record['start_time'] else None
+            yield json.dumps(record, separators=(',', ':')) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+@app.route('/export/shows.csv')
+def export_shows_csv():
+    rows = export_query()
+
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_COLUMNS)
+        for i, row in enumerate(rows, 1):
+            writer.writerow(export_values(row))
+            if i % EXPORT_BATCH_SIZE == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+    return Response(stream_with_context(generate()), mimetype='text/csv',
+                    headers={'Content-Disposition': 'attachment; filename=shows.csv'})
+
+
+#  API
+#  ----------------------------------------------------------------
+@app.route('/metrics')
+def prometheus_metrics():
+    lines = [metrics.prometheus()]
+    for key, value in sorted(pool_status(db.engine).items()):
+        if isinstance(value, (int, float)):
+            lines.append('fyyur_db_pool_{} {}\n'.format(key, value))
+    return Response(''.join(lines), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/metrics/pool')
+def pool_metrics():
+    return jsonify(pool_status(db.engine))
+
+
+@app.route('/api/typeahead')
+def typeahead():
+    kind = request.args.get('type')
+    limit = min(parsed_arg('limit', int) or TYPEAHEAD_LIMIT, 50)
+    results = get_name_index().complete(request.args.get('q', ''), limit=limit, kind=kind)
+
+    return jsonify(results=results)
+
+
 # ----------------------------------------------------------------------------#
 # Error Handlers
 # ----------------------------------------------------------------------------#
+@app.errorhandler(400)
+def bad_request_error(error):
+    return render_template('errors/400.html', error=error), 400
+
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
@@ -478,6 +897,75 @@ if not app.debug:
     app.logger.addHandler(file_handler)
     app.logger.info('errors')
 
+# ----------------------------------------------------------------------------#
+# Commands.
+# ----------------------------------------------------------------------------#
+@app.cli.command('check-indexes')
+def check_indexes():
+    """EXPLAIN each view's query and fail if any needs a sequential scan."""
+    now = datetime.now()
+    queries = [
+        ('venues', area_query()),
+        ('show_venue', venue_detail_query(1)),
+        ('show_artist', artist_detail_query(1)),
+        ('artists', keyset_query(artist_list_query(), ARTIST_LIST_KEYS).limit(PAGE_SIZE + 1)),
+        ('artists?after', keyset_query(artist_list_query(), ARTIST_LIST_KEYS, after=['M', 1]).limit(PAGE_SIZE + 1)),
+        ('shows', keyset_query(show_list_query(), SHOW_LIST_KEYS).limit(PAGE_SIZE + 1)),
+        ('shows?after', keyset_query(show_list_query(), SHOW_LIST_KEYS, after=[now, 1]).limit(PAGE_SIZE + 1)),
+        ('search_venues', search.postgres_search_query(Venue, 'jazz')),
+        ('search_artists', search.postgres_search_query(Artiste, 'jazz')),
+    ]
+    failures = check_query_plans(queries)
+    for label, query in queries:
+        if label in failures:
+            click.echo('FAIL {}: sequential scan on {}'.format(label, ', '.join(failures[label])))
+        else:
+            click.echo('ok   {}'.format(label))
+    if failures:
+        sys.exit(1)
+
+
+@app.cli.command('build-assets')
+def build_assets_command():
+    """Bundle, fingerprint and precompress the CSS/JS used by layouts/main.html."""
+    build_assets(app.static_folder, echo=click.echo)
+    click.echo('Restart the app to serve the new bundles.')
+
+
+@app.cli.command('archive-shows')
+@click.option('--days', default=0, show_default=True, help='Keep shows from the last N days in the hot table.')
+@click.option('--batch-size', default=10000, show_default=True)
+def archive_shows(days, batch_size):
+    """Move past shows from Show into ShowArchive in batches."""
+    moved = archive_past_shows(datetime.now() - timedelta(days=days), batch_size, echo=click.echo)
+    click.echo('Done: {} shows archived'.format(moved))
+
+
+@app.cli.command('roll-shows')
+def roll_shows():
+    """Move shows that have started from upcoming to past in the show counters.
+
+    Run periodically (e.g. every few minutes from cron); only venues and
+    artists whose next show has started are recomputed.
+    """
+    updated = refresh_show_counters(stale_only=True)
+    db.session.commit()
+    click.echo('Rolled forward {} venues/artists'.format(updated))
+
+
+@app.cli.command('import')
+@click.argument('kind', type=click.Choice(sorted(bulk_import.IMPORTS)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'file_format', type=click.Choice(['csv', 'jsonl']),
+              help='Input format; guessed from the file extension by default.')
+@click.option('--batch-size', default=bulk_import.BATCH_SIZE, show_default=True)
+@click.option('--resume/--restart', default=True, help='Continue from the last checkpoint.')
+def import_command(kind, path, file_format, batch_size, resume):
+    """Stream venues, artists or shows from a CSV or JSONL file."""
+    imported, rejected = bulk_import.import_file(kind, path, file_format, batch_size, resume, echo=click.echo)
+    click.echo('Done: {} imported, {} rejected'.format(imported, rejected))
+
+
 # ----------------------------------------------------------------------------#
 # Launch.
 # ----------------------------------------------------------------------------#
@@ -0,0 +1,86 @@
+from datetime import datetime
+
+from sqlalchemy.orm import aliased
+
+from models import db, Show, ShowArchive
+
+ARCHIVE_BATCH_SIZE = 10000
+
+
+def archive_past_shows(before=None, batch_size=ARCHIVE_BATCH_SIZE, echo=None):
+    """Move shows that started before `before` from Show to ShowArchive.
+
+    Each batch is copied and deleted in its own transaction, so the hot table
+    is never locked for long and an interrupted run can simply be restarted.
+    Returns the number of shows moved.
+    """
+    if before is None:
+        before = datetime.now()
+    shows = Show.__table__
+    archive = ShowArchive.__table__
+    columns = [shows.c.id, shows.c.artiste_id, shows.c.venue_id, shows.c.start_time, shows.c.duration]
+    moved = 0
+    while True:
+        ids = [row.id for row in db.session.query(Show.id)
+               .filter(Show.start_time < before)
+               .order_by(Show.start_time, Show.id)
+               .limit(batch_size)]
+        if not ids:
+            break
+        db.session.execute(archive.insert().from_select(
+            [column.name for column in columns], db.select(columns).where(shows.c.id.in_(ids))))
+        db.session.execute(shows.delete().where(shows.c.id.in_(ids)))
+        db.session.commit()
+        moved += len(ids)
+        if echo is not None:
+            echo('Archived {} shows'.format(moved))
+    return moved
+
+
+def all_shows():
+    """Show and ShowArchive as one entity with Show's columns, over a UNION ALL of both tables."""
+    columns = ('id', 'artiste_id', 'venue_id', 'start_time', 'duration')
+    union = db.union_all(db.select([getattr(Show, column) for column in columns]),
+                         db.select([getattr(ShowArchive, column) for column in columns]))
+    return aliased(Show, union.subquery('all_shows'))
+
+
+def shows_from(start=None):
+    """The entity to read shows starting at or after `start` (None: any time) from.
+
+    That is Show alone unless the archive holds shows in that range; the
+    latest archived start_time is one lookup on ix_ShowArchive_start_time_id.
+    """
+    latest = db.session.query(db.func.max(ShowArchive.start_time)).scalar()
+    if latest is None or (start is not None and latest < start):
+        return Show
+    return all_shows()
+
+
+class PastShows(object):
+    """Past shows of one venue or artist: recent ones still in Show plus the archive.
+
+    `archived_rows` returns the archived rows oldest first. It is only called
+    when the list is iterated or measured, i.e. when the template actually
+    renders the past-shows section.
+    """
+
+    def __init__(self, recent, archived_rows, to_show):
+        self.recent = recent
+        self.archived_rows = archived_rows
+        self.to_show = to_show
+        self.archived = None
+
+    def load(self):
+        if self.archived is None:
+            self.archived = [self.to_show(row) for row in self.archived_rows()]
+        return self.archived
+
+    def __iter__(self):
+        # archived shows all started before the recent ones
+        return iter(self.load() + self.recent)
+
+    def __len__(self):
+        # the template lists the shows right after counting them, so fetch
+        # once here rather than running a separate COUNT
+        return len(self.load()) + len(self.recent)
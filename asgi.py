@@ -0,0 +1,170 @@
+"""ASGI entry point: uvicorn asgi:asgi_app --workers 4
+
+Venue and artist pages have their queries run concurrently on the event loop
+through SQLAlchemy's asyncio engine, so the wait for the database holds no
+thread; the Flask view then only renders the rows. Every other route runs the
+Flask app as usual. Flask runs on a pool of ASGI_THREADS threads per worker.
+"""
+import asyncio
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import SpooledTemporaryFile
+
+from sqlalchemy.exc import SQLAlchemyError
+from werkzeug.exceptions import HTTPException
+from werkzeug.http import parse_cookie
+
+import replica
+from app import app, page_cache, PAGE_QUERIES, PREFETCHED_ROWS
+from async_db import AsyncDatabase
+from instrumentation import PREFETCH_STATS, QueryStats, current_stats
+
+# request bodies larger than this are spooled to a temporary file
+BODY_IN_MEMORY = 64 * 1024
+
+
+def build_environ(scope, body):
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf8').decode('latin1'),
+        'PATH_INFO': scope['path'].encode('utf8').decode('latin1'),
+        'QUERY_STRING': scope['query_string'].decode('latin1'),
+        'SERVER_PROTOCOL': 'HTTP/' + scope['http_version'],
+        'SERVER_NAME': (scope.get('server') or ('localhost', 80))[0],
+        'SERVER_PORT': str((scope.get('server') or ('localhost', 80))[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope['headers']:
+        name = name.decode('latin1').upper().replace('-', '_')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = 'HTTP_' + name
+        value = value.decode('latin1')
+        environ[name] = environ[name] + ',' + value if name in environ else value
+    return environ
+
+
+class AsgiApp(object):
+    """Serves a Flask app over ASGI, prefetching the rows of PAGE_QUERIES pages asynchronously."""
+
+    def __init__(self, flask_app):
+        self.app = flask_app
+        self.executor = ThreadPoolExecutor(flask_app.config['ASGI_THREADS'], thread_name_prefix='asgi')
+        self.db = AsyncDatabase(flask_app.config)
+        self.urls = flask_app.url_map.bind('localhost')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            return
+        stats = QueryStats()
+        extra = {PREFETCH_STATS: stats}
+        page = self.page_statements(scope)
+        if page is not None:
+            statements, read_replica = page
+            # the concurrent queries' cursor events count towards this request
+            token = current_stats.set(stats)
+            try:
+                extra[PREFETCHED_ROWS] = await self.db.fetch_all(statements, read_replica)
+            except SQLAlchemyError:
+                # the view runs its queries itself, and reports any error as usual
+                self.app.logger.exception('prefetch failed for %s', scope['path'])
+            finally:
+                current_stats.reset(token)
+        await self.call_flask(scope, receive, send, extra)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.db.dispose()
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def page_statements(self, scope):
+        """(statements, read from the replica) for a page whose queries can run here, else None."""
+        method = scope['method']
+        if method not in ('GET', 'HEAD'):
+            return None
+        try:
+            endpoint, args = self.urls.match(scope['path'], method=method)
+        except HTTPException:
+            return None
+        if endpoint not in PAGE_QUERIES:
+            return None
+        # cached_page's key is request.full_path; a cached page needs no rows
+        if page_cache.get(scope['path'] + '?' + scope['query_string'].decode('latin1')) is not None:
+            return None
+        cookie = dict(scope['headers']).get(b'cookie', b'').decode('latin1')
+        try:
+            primary_until = float(parse_cookie(cookie).get(replica.PRIMARY_UNTIL_COOKIE, ''))
+        except ValueError:
+            primary_until = None
+        read_replica = replica.reads_from_replica(self.app, method, endpoint, primary_until, time.time())
+        # Query.statement keeps the ORM entities; building it opens no connection
+        with self.app.app_context():
+            return [query.statement for query in PAGE_QUERIES[endpoint](**args)], read_replica
+
+    async def call_flask(self, scope, receive, send, extra):
+        body = SpooledTemporaryFile(max_size=BODY_IN_MEMORY)
+        try:
+            while True:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    return
+                body.write(message.get('body', b''))
+                if not message.get('more_body'):
+                    break
+            body.seek(0)
+            environ = build_environ(scope, body)
+            environ.update(extra)
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self.executor, self.run_flask, environ, send, loop)
+        finally:
+            body.close()
+
+    def run_flask(self, environ, send, loop):
+        # on a pool thread; the response messages are sent by the event loop
+        def send_message(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        response = {'status': None, 'headers': None, 'started': False}
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info is not None and response['started']:
+                raise exc_info[1].with_traceback(exc_info[2])
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [(name.lower().encode('latin1'), value.encode('latin1')) for name, value in headers]
+
+        def start():
+            if not response['started']:
+                send_message({'type': 'http.response.start', 'status': response['status'],
+                              'headers': response['headers']})
+                response['started'] = True
+
+        result = self.app(environ, start_response)
+        try:
+            for chunk in result:
+                if chunk:
+                    start()
+                    send_message({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            start()
+            send_message({'type': 'http.response.body', 'body': b''})
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+
+
+asgi_app = AsgiApp(app)
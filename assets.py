@@ -0,0 +1,127 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+
+from flask import current_app, request, send_from_directory, url_for
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# bundle -> source files under static/, concatenated in order. Bundles live
+# next to their sources so relative url()s in the CSS keep working.
+BUNDLES = {
+    'css/site.css': ['css/bootstrap.min.css',
+                     'css/layout.main.css',
+                     'css/main.css',
+                     'css/main.responsive.css',
+                     'css/main.quickfix.css'],
+    'js/head.js': ['js/libs/modernizr-2.8.2.min.js',
+                   'js/libs/moment.min.js'],
+    'js/site.js': ['js/script.js',
+                   'js/libs/bootstrap-3.1.1.min.js',
+                   'js/plugins.js'],
+}
+MANIFEST = 'manifest.json'
+# fingerprinted files never change, so browsers may keep them for a year without revalidating
+IMMUTABLE = 'public, max-age=31536000, immutable'
+# Content-Encoding -> suffix of the precompressed file, most preferred first
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+# ----------------------------------------------------------------------------#
+# Build.
+# ----------------------------------------------------------------------------#
+def write_file(path, body):
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(body)
+    os.replace(tmp, path)
+
+
+def build_assets(static_folder, bundles=BUNDLES, echo=print):
+    """Write each bundle as <name>.<hash>.<ext> with .gz and .br siblings, plus the manifest.
+
+    The manifest maps bundle names to fingerprinted file names and records
+    which precompressed variants exist. Returns the manifest.
+    """
+    manifest = {'bundles': {}, 'encodings': {}}
+    for name, sources in sorted(bundles.items()):
+        separator = b'\n;\n' if name.endswith('.js') else b'\n'
+        parts = []
+        for source in sources:
+            with open(os.path.join(static_folder, source), 'rb') as f:
+                parts.append(f.read())
+        body = separator.join(parts)
+        root, ext = os.path.splitext(name)
+        filename = '{}.{}{}'.format(root, hashlib.sha256(body).hexdigest()[:12], ext)
+        path = os.path.join(static_folder, filename)
+        write_file(path, body)
+        # mtime=0 keeps the archives byte-identical between builds
+        write_file(path + '.gz', gzip.compress(body, compresslevel=9, mtime=0))
+        encodings = ['gzip']
+        if brotli is not None:
+            write_file(path + '.br', brotli.compress(body, quality=11))
+            encodings.insert(0, 'br')
+        manifest['bundles'][name] = filename
+        manifest['encodings'][filename] = encodings
+        echo('{} -> {} ({} bytes, {})'.format(name, filename, len(body), ', '.join(encodings)))
+    write_file(os.path.join(static_folder, MANIFEST), json.dumps(manifest, indent=2, sort_keys=True).encode())
+    return manifest
+
+
+# ----------------------------------------------------------------------------#
+# Serving.
+# ----------------------------------------------------------------------------#
+class Assets(object):
+    """Serves built bundles precompressed and immutable, and resolves bundle URLs.
+
+    Templates call `asset_urls(bundle)`: the fingerprinted file once
+    `flask build-assets` has run, otherwise the individual source files, so
+    development works without a build. The manifest is read at startup.
+    """
+
+    def __init__(self, app=None):
+        self.bundles = BUNDLES
+        self.manifest = {'bundles': {}, 'encodings': {}}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.static_folder = app.static_folder
+        self.load()
+        app.jinja_env.globals['asset_urls'] = self.urls
+        app.view_functions['static'] = self.send_static_file
+
+    def load(self):
+        try:
+            with open(os.path.join(self.static_folder, MANIFEST)) as f:
+                self.manifest = json.load(f)
+        except (IOError, ValueError):
+            self.manifest = {'bundles': {}, 'encodings': {}}
+
+    def urls(self, bundle):
+        filename = self.manifest['bundles'].get(bundle)
+        if filename is not None:
+            return [url_for('static', filename=filename)]
+        return [url_for('static', filename=source) for source in self.bundles[bundle]]
+
+    def send_static_file(self, filename):
+        encodings = self.manifest['encodings'].get(filename)
+        if encodings is None:
+            return current_app.send_static_file(filename)
+
+        mimetype = mimetypes.guess_type(filename)[0]
+        for encoding, suffix in ENCODINGS:
+            if encoding in encodings and request.accept_encodings[encoding]:
+                response = send_from_directory(self.static_folder, filename + suffix, mimetype=mimetype)
+                response.headers['Content-Encoding'] = encoding
+                break
+        else:
+            response = send_from_directory(self.static_folder, filename, mimetype=mimetype)
+        response.headers['Cache-Control'] = IMMUTABLE
+        response.vary.add('Accept-Encoding')
+        return response
@@ -0,0 +1,76 @@
+import asyncio
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from replica import REPLICA
+
+# sync backend -> asyncio driver for the same database
+ASYNC_DRIVERS = {
+    'postgres': 'postgresql+asyncpg',
+    'postgresql': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite',
+}
+
+
+def async_url(url):
+    """`url` with its driver swapped for the asyncio one, e.g. postgresql+asyncpg://."""
+    url = make_url(url)
+    return url.set(drivername=ASYNC_DRIVERS.get(url.get_backend_name(), url.drivername))
+
+
+def async_engine_options(config):
+    """Engine options from the DB_* settings in config.py, as db_pool.engine_options does for the sync engine."""
+    if not config['SQLALCHEMY_DATABASE_URI'].startswith('postgres'):
+        return {}
+    if config['DB_POOLER_MODE'] == 'transaction':
+        # the pooler may hand each transaction a different server connection,
+        # which asyncpg's per-connection prepared statements cannot survive
+        return {'poolclass': NullPool, 'connect_args': {'statement_cache_size': 0}}
+    options = {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+    }
+    if config['DB_STATEMENT_TIMEOUT']:
+        options['connect_args'] = {'server_settings': {'statement_timeout': str(config['DB_STATEMENT_TIMEOUT'])}}
+    return options
+
+
+class AsyncDatabase(object):
+    """The asyncio engines of one ASGI worker: the primary, and the replica when configured.
+
+    Pooled asyncio connections belong to the event loop that opened them, so
+    the engines are created on first use inside the server's loop and shared
+    by every request that loop serves.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.engines = {}
+
+    def engine(self, bind=None):
+        if bind not in self.engines:
+            url = self.config['SQLALCHEMY_BINDS'][bind] if bind else self.config['SQLALCHEMY_DATABASE_URI']
+            self.engines[bind] = create_async_engine(async_url(url), **async_engine_options(self.config))
+        return self.engines[bind]
+
+    async def fetch(self, statement, bind=None):
+        # each statement gets its own session and connection so several can run at
+        # once; ORM statements (Query.statement) return the same rows as Query.all()
+        async with AsyncSession(self.engine(bind)) as session:
+            result = await session.execute(statement)
+            return result.all()
+
+    async def fetch_all(self, statements, replica=False):
+        """The rows of each statement, all run concurrently."""
+        bind = REPLICA if replica else None
+        return list(await asyncio.gather(*(self.fetch(statement, bind) for statement in statements)))
+
+    async def dispose(self):
+        for engine in self.engines.values():
+            await engine.dispose()
+        self.engines.clear()
@@ -0,0 +1,28 @@
+from models import db, Area, Venue, area_key
+from scheduling import booked_intervals, overlapping
+
+
+def venue_criteria(area_id, genre=None):
+    criteria = [Venue.area_id == area_id]
+    if genre and db.engine.dialect.name == 'postgresql':
+        criteria.append(Venue.genres.contains([genre]))
+    return criteria
+
+
+def free_venue_ids(city, state, genre, start, end):
+    """Ids of venues in (city, state) hosting `genre` with no show overlapping [start, end).
+
+    After the Area lookup, two queries however many venues match: the
+    candidate venues, and one range scan of their shows around the window,
+    checked per venue against its sorted intervals. Ordered by venue name.
+    """
+    area = db.session.query(Area.id).filter(Area.key == area_key(city, state)).first()
+    if area is None:
+        return []
+    criteria = venue_criteria(area.id, genre)
+    venues = db.session.query(Venue.id, Venue.genres).filter(*criteria).order_by(Venue.name, Venue.id).all()
+    if genre and db.engine.dialect.name != 'postgresql':
+        # JSON genres elsewhere: no containment operator, filter here
+        venues = [venue for venue in venues if genre in (venue.genres or ())]
+    booked = booked_intervals(start, end, *criteria)
+    return [venue.id for venue in venues if overlapping(booked.get(venue.id, []), start, end) is None]
@@ -0,0 +1,133 @@
+"""Drive the venue and artist pages with many concurrent clients, WSGI threads vs asgi.py.
+
+    python -m benchmarks.concurrency --clients 200 --threads 16
+    python -m benchmarks.concurrency --database postgresql://localhost/fyyur_bench --clients 500
+
+Both modes run in this process with the same threads and connections: "wsgi" calls
+the Flask app on a thread pool as a threaded WSGI server would, "asgi" calls
+asgi.asgi_app, which prefetches the pages' rows on the event loop. The page
+cache is disabled so every request reaches the database. The database is
+dropped and recreated, so point --database at a throwaway one.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.run import percentile
+
+
+def page_urls(args, rng):
+    while True:
+        if rng.random() < 0.5:
+            yield '/venues/{}'.format(rng.randint(1, args.venues))
+        else:
+            yield '/artists/{}'.format(rng.randint(1, args.artists))
+
+
+async def drive(get, urls, clients, requests):
+    """Run `requests` GETs from `clients` concurrent clients; returns (latencies, statuses, seconds)."""
+    latencies = []
+    statuses = set()
+    remaining = [requests]
+
+    async def client():
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            started = time.perf_counter()
+            statuses.add(await get(next(urls)))
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(clients)))
+    return sorted(latencies), statuses, time.perf_counter() - started
+
+
+def wsgi_getter(app, threads):
+    from werkzeug.test import create_environ, run_wsgi_app
+
+    executor = ThreadPoolExecutor(threads)
+
+    def get(url):
+        app_iter, status, headers = run_wsgi_app(app, create_environ(url))
+        b''.join(app_iter)
+        return int(status.split(' ', 1)[0])
+
+    async def fetch(url):
+        return await asyncio.get_running_loop().run_in_executor(executor, get, url)
+
+    return fetch
+
+
+def asgi_getter(asgi_app):
+    async def fetch(url):
+        path, _, query = url.partition('?')
+        scope = {'type': 'http', 'method': 'GET', 'path': path, 'query_string': query.encode(),
+                 'root_path': '', 'headers': [], 'http_version': '1.1', 'scheme': 'http',
+                 'server': ('bench', 80), 'client': ('127.0.0.1', 0)}
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            messages.append(message)
+
+        await asgi_app(scope, receive, send)
+        return messages[0]['status']
+
+    return fetch
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database', help='SQLAlchemy URL of a throwaway database (default: a temporary SQLite file)')
+    parser.add_argument('--venues', type=int, default=1000)
+    parser.add_argument('--artists', type=int, default=2000)
+    parser.add_argument('--shows', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--clients', type=int, default=200, help='concurrent clients')
+    parser.add_argument('--threads', type=int, default=16, help='Flask threads in both modes (ASGI_THREADS)')
+    parser.add_argument('--requests', type=int, default=2000, help='requests per mode')
+    parser.add_argument('--pool-size', type=int, default=50,
+                        help='database connections per mode (DB_POOL_SIZE, no overflow)')
+    args = parser.parse_args(argv)
+
+    database = args.database or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'fyyur_bench.db')
+    # config.py reads these when app is imported
+    os.environ['DATABASE_URL'] = database
+    os.environ['PAGE_CACHE_BYTES'] = '0'
+    os.environ['ASGI_THREADS'] = str(args.threads)
+    # each mode gets the same connections; with the default pool both would wait on it
+    os.environ['DB_POOL_SIZE'] = str(args.pool_size)
+    os.environ['DB_MAX_OVERFLOW'] = '0'
+    # every request is slow with this many clients queued; don't log each one
+    os.environ['SLOW_REQUEST_MS'] = str(10 ** 9)
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from app import app
+    from asgi import asgi_app
+    from benchmarks import dataset
+
+    with app.app_context():
+        dataset.load(args.venues, args.artists, args.shows, seed=args.seed)
+
+    async def run():
+        print('{:<6} {:>8} {:>8} {:>9} {:>9} {:>9}  {}'.format(
+            'mode', 'clients', 'threads', 'req/s', 'p50 ms', 'p95 ms', 'status'))
+        for mode, get in (('wsgi', wsgi_getter(app, args.threads)), ('asgi', asgi_getter(asgi_app))):
+            urls = page_urls(args, random.Random(args.seed))
+            latencies, statuses, elapsed = await drive(get, urls, args.clients, args.requests)
+            print('{:<6} {:>8} {:>8} {:>9.1f} {:>9.2f} {:>9.2f}  {}'.format(
+                mode, args.clients, args.threads, len(latencies) / elapsed,
+                percentile(latencies, 50) * 1000, percentile(latencies, 95) * 1000, sorted(statuses)))
+        await asgi_app.db.dispose()
+
+    asyncio.run(run())
+
+
+if __name__ == '__main__':
+    main()
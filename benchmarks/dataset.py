@@ -0,0 +1,162 @@
+import random
+from itertools import accumulate
+from datetime import datetime, timedelta
+
+from forms import GENRE_CHOICES
+from models import db, Venue, Artiste, Show, DEFAULT_SHOW_DURATION, refresh_show_counters, assign_areas, \
+    refresh_area_counts
+from flask_migrate import upgrade
+
+from bulk_import import insert_rows
+
+# (city, state), most popular first; picked with Zipf-like weights
+CITIES = [
+    ('New York', 'NY'), ('Los Angeles', 'CA'), ('Chicago', 'IL'), ('Houston', 'TX'),
+    ('Phoenix', 'AZ'), ('Philadelphia', 'PA'), ('San Antonio', 'TX'), ('San Diego', 'CA'),
+    ('Dallas', 'TX'), ('San Jose', 'CA'), ('Austin', 'TX'), ('Jacksonville', 'FL'),
+    ('San Francisco', 'CA'), ('Columbus', 'OH'), ('Seattle', 'WA'), ('Denver', 'CO'),
+    ('Nashville', 'TN'), ('Boston', 'MA'), ('Portland', 'OR'), ('Las Vegas', 'NV'),
+    ('Detroit', 'MI'), ('Memphis', 'TN'), ('Baltimore', 'MD'), ('Milwaukee', 'WI'),
+    ('Atlanta', 'GA'), ('Miami', 'FL'), ('Minneapolis', 'MN'), ('New Orleans', 'LA'),
+    ('Cleveland', 'OH'), ('Omaha', 'NE'),
+]
+GENRES = [value for value, label in GENRE_CHOICES]
+ADJECTIVES = ['Blue', 'Golden', 'Velvet', 'Electric', 'Midnight', 'Rusty', 'Silver', 'Wild',
+              'Crimson', 'Hollow', 'Neon', 'Lucky', 'Broken', 'Paper', 'Iron', 'Quiet']
+NOUNS = ['Note', 'Room', 'Hall', 'Lounge', 'Owl', 'Moon', 'River', 'Garden',
+         'Tavern', 'Echo', 'Fox', 'Harbor', 'Cellar', 'Lantern', 'Anchor', 'Parlor']
+
+BATCH_SIZE = 5000
+# tries for a free (venue, slot) before show_rows gives up
+MAX_SLOT_DRAWS = 1000
+
+
+def zipf_weights(n, s=1.0):
+    return [1.0 / (rank ** s) for rank in range(1, n + 1)]
+
+
+def zipf_cum_weights(n, s=1.0):
+    # cumulative weights let random.choices bisect instead of summing per pick
+    return list(accumulate(zipf_weights(n, s)))
+
+
+def pick_genres(rng, weights):
+    count = rng.choice((1, 1, 2, 2, 3))
+    return sorted(set(rng.choices(GENRES, weights=weights, k=count)))
+
+
+def venue_rows(rng, count):
+    city_weights = zipf_weights(len(CITIES))
+    genre_weights = zipf_weights(len(GENRES), 0.7)
+    for venue_id in range(1, count + 1):
+        city, state = rng.choices(CITIES, weights=city_weights)[0]
+        yield {'id': venue_id,
+               'name': 'The {} {} {}'.format(rng.choice(ADJECTIVES), rng.choice(NOUNS), venue_id),
+               'city': city,
+               'state': state,
+               'address': '{} {} St'.format(rng.randint(1, 9999), rng.choice(NOUNS)),
+               'phone': '{:03d}-{:03d}-{:04d}'.format(rng.randint(200, 999), rng.randint(0, 999), rng.randint(0, 9999)),
+               'image_link': 'https://images.example.com/venues/{}.jpg'.format(venue_id),
+               'facebook_link': 'https://www.facebook.com/venue{}'.format(venue_id),
+               'seeking_talent': rng.random() < 0.3,
+               'seeking_description': None,
+               'website': 'https://venue{}.example.com'.format(venue_id),
+               'genres': pick_genres(rng, genre_weights)}
+
+
+def artist_rows(rng, count):
+    city_weights = zipf_weights(len(CITIES))
+    genre_weights = zipf_weights(len(GENRES), 0.7)
+    for artist_id in range(1, count + 1):
+        city, state = rng.choices(CITIES, weights=city_weights)[0]
+        yield {'id': artist_id,
+               'name': '{} {} {}'.format(rng.choice(ADJECTIVES), rng.choice(NOUNS), artist_id),
+               'city': city,
+               'state': state,
+               'phone': '{:03d}-{:03d}-{:04d}'.format(rng.randint(200, 999), rng.randint(0, 999), rng.randint(0, 9999)),
+               'genres': pick_genres(rng, genre_weights),
+               'image_link': 'https://images.example.com/artists/{}.jpg'.format(artist_id),
+               'facebook_link': 'https://www.facebook.com/artist{}'.format(artist_id),
+               'seeking_venue': rng.random() < 0.4,
+               'seeking_description': None,
+               'website': None}
+
+
+def show_rows(rng, count, venues, artists, now, spread_days=365):
+    # popular venues and artists get more shows; times spread evenly around `now`
+    # in DEFAULT_SHOW_DURATION slots, never two in the same slot at one venue
+    venue_ids = range(1, venues + 1)
+    artist_ids = range(1, artists + 1)
+    venue_weights = zipf_cum_weights(venues, 0.6)
+    artist_weights = zipf_cum_weights(artists, 0.6)
+    slots = spread_days * 24 * 60 // DEFAULT_SHOW_DURATION
+    # past half full, popular venues run out of free slots and redraws get slow
+    if count > venues * (2 * slots + 1) // 2:
+        raise ValueError('{} shows do not fit in {} venues over {} days'.format(count, venues, spread_days))
+    booked = set()
+    for show_id in range(1, count + 1):
+        # redraw the venue too, so a venue whose slots are all taken cannot stall the loop
+        for attempt in range(MAX_SLOT_DRAWS):
+            venue_id = rng.choices(venue_ids, cum_weights=venue_weights)[0]
+            slot = rng.randint(-slots, slots)
+            if (venue_id, slot) not in booked:
+                break
+        else:
+            raise ValueError('No free slot found for show {} after {} draws'.format(show_id, MAX_SLOT_DRAWS))
+        booked.add((venue_id, slot))
+        yield {'id': show_id,
+               'venue_id': venue_id,
+               'artiste_id': rng.choices(artist_ids, cum_weights=artist_weights)[0],
+               'start_time': now + timedelta(minutes=slot * DEFAULT_SHOW_DURATION),
+               'duration': DEFAULT_SHOW_DURATION}
+
+
+def insert_all(model, rows, batch_size=BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            insert_rows(model.__table__, batch)
+            batch = []
+    if batch:
+        insert_rows(model.__table__, batch)
+    db.session.commit()
+
+
+def reset_sequences():
+    # rows are inserted with explicit ids, so move the serial sequences past them
+    if db.engine.dialect.name != 'postgresql':
+        return
+    for model in (Venue, Artiste, Show):
+        db.session.execute(db.text(
+            "SELECT setval(pg_get_serial_sequence('\"{0}\"', 'id'), COALESCE(MAX(id), 1)) FROM \"{0}\"".format(
+                model.__tablename__)))
+    db.session.commit()
+
+
+def create_schema():
+    # PostgreSQL gets the real migrations (and their indexes); SQLite gets the bare models
+    db.drop_all()
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute(db.text('DROP TABLE IF EXISTS alembic_version'))
+        db.session.commit()
+        upgrade()
+    else:
+        db.create_all()
+
+
+def load(venues, artists, shows, seed=0, now=None):
+    """Recreate the tables and fill them with a deterministic synthetic dataset."""
+    if now is None:
+        now = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    rng = random.Random(seed)
+    create_schema()
+    insert_all(Venue, venue_rows(rng, venues))
+    insert_all(Artiste, artist_rows(rng, artists))
+    insert_all(Show, show_rows(rng, shows, venues, artists, now))
+    refresh_show_counters()
+    assign_areas(Venue)
+    assign_areas(Artiste)
+    refresh_area_counts()
+    db.session.commit()
+    reset_sequences()
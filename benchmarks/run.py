@@ -0,0 +1,228 @@
+"""Load a synthetic dataset and measure every route through the Flask test client.
+
+    python -m benchmarks.run --venues 2000 --artists 5000 --shows 100000
+    python -m benchmarks.run --database postgresql://localhost/fyyur_bench --json bench.json
+
+The database is dropped and recreated, so point --database at a throwaway one.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+SERVER_TIMING_QUERIES = re.compile(r'desc="(\d+) queries"')
+
+
+def percentile(values, p):
+    # nearest-rank percentile of an already sorted list
+    if not values:
+        return 0.0
+    return values[max(0, int(math.ceil(p / 100.0 * len(values))) - 1)]
+
+
+def venue_form(name):
+    return {'name': name,
+            'city': 'Austin',
+            'state': 'TX',
+            'address': '1 Main St',
+            'phone': '512-555-0100',
+            'genres': 'Jazz',
+            'facebook_link': 'https://www.facebook.com/bench',
+            'image_link': 'https://images.example.com/bench.jpg',
+            'website_link': 'https://bench.example.com',
+            'seeking_talent': 'y',
+            'seeking_description': 'benchmark'}
+
+
+def artist_form(name):
+    return {'name': name,
+            'city': 'Austin',
+            'state': 'TX',
+            'phone': '512-555-0100',
+            'genres': 'Jazz',
+            'facebook_link': 'https://www.facebook.com/bench',
+            'image_link': 'https://images.example.com/bench.jpg',
+            'website_link': 'https://bench.example.com',
+            'seeking_venue': 'y',
+            'seeking_description': 'benchmark'}
+
+
+class JsonBody(dict):
+    """Request data that is posted as a JSON body instead of a form."""
+
+
+def routes(args, rng, now):
+    """(label, method, url, form data) factories, one per route in app.py."""
+    from app import app
+    from models import db, Venue, Artiste, Show, DEFAULT_SHOW_DURATION
+    from pagination import encode_cursor
+
+    venue = lambda: rng.randint(1, args.venues)
+    artist = lambda: rng.randint(1, args.artists)
+    created_venues = []
+    with app.app_context():
+        last_show = db.session.query(db.func.max(Show.start_time)).scalar() or now
+    booked = []
+
+    def free_slot():
+        # each posted show starts after every other one, so none is a double booking
+        booked.append(last_show + timedelta(minutes=(len(booked) + 1) * DEFAULT_SHOW_DURATION))
+        return booked[-1].strftime('%Y-%m-%d %H:%M:%S')
+
+    def create_show():
+        return 'POST', '/shows/create', {'venue_id': str(venue()), 'artiste_id': str(artist()), 'start_time': free_slot()}
+
+    def create_tour(size=10):
+        artiste_id = artist()
+        return 'POST', '/shows/batch', JsonBody(shows=[
+            {'venue_id': venue(), 'artiste_id': artiste_id, 'start_time': free_slot()} for _ in range(size)])
+
+    def create_venue():
+        created_venues.append(args.venues + len(created_venues) + 1)
+        return 'POST', '/venues/create', venue_form('Bench Venue {}'.format(len(created_venues)))
+
+    def edit(model, item_id, form):
+        # the edit views only save against the current version, which each edit bumps
+        with app.app_context():
+            form['version'] = db.session.query(model.version).filter(model.id == item_id).scalar()
+        return 'POST', '/{}/{}/edit'.format('venues' if model is Venue else 'artists', item_id), form
+
+    def delete_venue():
+        # only venues created by this run have no shows, so only they can be deleted
+        venue_id = created_venues.pop() if created_venues else args.venues + 1
+        return 'GET', '/venues/{}/delete'.format(venue_id), None
+
+    return [
+        ('index', lambda: ('GET', '/', None)),
+        ('venues', lambda: ('GET', '/venues', None)),
+        ('search_venues GET', lambda: ('GET', '/venues/search?search_term=' + rng.choice(['blue', 'hall', 'jazz', 'austin']), None)),
+        ('search_venues POST', lambda: ('POST', '/venues/search', {'search_term': rng.choice(['velvet', 'room', 'rock'])})),
+        ('show_venue', lambda: ('GET', '/venues/{}'.format(venue()), None)),
+        ('create_venue_form', lambda: ('GET', '/venues/create', None)),
+        ('create_venue_submission', create_venue),
+        ('edit_venue', lambda: ('GET', '/venues/{}/edit'.format(venue()), None)),
+        ('edit_venue_submission', lambda: edit(Venue, args.venues + 1, venue_form('Edited Venue'))),
+        ('delete_venue', delete_venue),
+        ('artists', lambda: ('GET', '/artists', None)),
+        ('artists?after', lambda: ('GET', '/artists?after=' + encode_cursor(['M', 0]), None)),
+        ('search_artists GET', lambda: ('GET', '/artists/search?search_term=' + rng.choice(['neon', 'fox', 'soul']), None)),
+        ('search_artists POST', lambda: ('POST', '/artists/search', {'search_term': rng.choice(['iron', 'echo', 'pop'])})),
+        ('show_artist', lambda: ('GET', '/artists/{}'.format(artist()), None)),
+        ('create_artist_form', lambda: ('GET', '/artists/create', None)),
+        ('create_artist_submission', lambda: ('POST', '/artists/create', artist_form('Bench Artist'))),
+        ('edit_artist', lambda: ('GET', '/artists/{}/edit'.format(artist()), None)),
+        ('edit_artist_submission', lambda: edit(Artiste, args.artists + 1, artist_form('Edited Artist'))),
+        ('create_shows', lambda: ('GET', '/shows/create', None)),
+        ('create_show_submission', create_show),
+        ('create_shows_batch', create_tour),
+        ('shows', lambda: ('GET', '/shows', None)),
+        ('shows?after', lambda: ('GET', '/shows?after=' + encode_cursor([now, 0]), None)),
+        ('export_shows_ndjson', lambda: ('GET', '/export/shows.ndjson?venue_id={}'.format(venue()), None)),
+        ('export_shows_csv', lambda: ('GET', '/export/shows.csv?artist_id={}'.format(artist()), None)),
+        ('typeahead', lambda: ('GET', '/api/typeahead?q=' + rng.choice(['the b', 'neo', 'gold']), None)),
+        ('api_v1 venues', lambda: ('GET', '/api/v1/venues?fields=id,name,city', None)),
+        ('api_v1 venue', lambda: ('GET', '/api/v1/venues/{}'.format(venue()), None)),
+        ('api_v1 artists search', lambda: ('GET', '/api/v1/artists/search?q=' + rng.choice(['wild', 'moon']), None)),
+        ('api_v1 shows', lambda: ('GET', '/api/v1/shows?venue_id={}'.format(venue()), None)),
+        ('metrics', lambda: ('GET', '/metrics', None)),
+        ('pool_metrics', lambda: ('GET', '/metrics/pool', None)),
+    ]
+
+
+def measure(client, label, factory, count):
+    latencies = []
+    queries = []
+    statuses = set()
+    started = time.perf_counter()
+    for _ in range(count):
+        method, url, data = factory()
+        request_started = time.perf_counter()
+        if isinstance(data, JsonBody):
+            response = client.open(url, method=method, json=data)
+        else:
+            response = client.open(url, method=method, data=data)
+        response.get_data()
+        latencies.append(time.perf_counter() - request_started)
+        statuses.add(response.status_code)
+        match = SERVER_TIMING_QUERIES.search(response.headers.get('Server-Timing', ''))
+        if match:
+            queries.append(int(match.group(1)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {'route': label,
+            'requests': count,
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p95_ms': percentile(latencies, 95) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+            'rps': count / elapsed if elapsed else 0.0,
+            'queries': sum(queries) / float(len(queries)) if queries else None,
+            'statuses': sorted(statuses)}
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database', help='SQLAlchemy URL of a throwaway database (default: a temporary SQLite file)')
+    parser.add_argument('--venues', type=int, default=1000)
+    parser.add_argument('--artists', type=int, default=2000)
+    parser.add_argument('--shows', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--requests', type=int, default=50, help='requests per route')
+    parser.add_argument('--no-page-cache', action='store_true', help='render every page instead of serving it from the page cache')
+    parser.add_argument('--routes', help='only run routes whose label contains this text')
+    parser.add_argument('--json', dest='json_path', help='also write the results to this file')
+    args = parser.parse_args(argv)
+
+    database = args.database or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'fyyur_bench.db')
+    # config.py reads these when app is imported
+    os.environ['DATABASE_URL'] = database
+    if args.no_page_cache:
+        os.environ['PAGE_CACHE_BYTES'] = '0'
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from app import app
+    from benchmarks import dataset
+
+    now = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    rng = random.Random(args.seed)
+    with app.app_context():
+        started = time.perf_counter()
+        dataset.load(args.venues, args.artists, args.shows, seed=args.seed, now=now)
+        print('Loaded {} venues, {} artists, {} shows into {} in {:.1f}s'.format(
+            args.venues, args.artists, args.shows, database, time.perf_counter() - started))
+
+    client = app.test_client()
+    results = []
+    print('{:<28} {:>9} {:>9} {:>9} {:>9} {:>8}  {}'.format('route', 'p50 ms', 'p95 ms', 'p99 ms', 'req/s', 'queries', 'status'))
+    for label, factory in routes(args, rng, now):
+        if args.routes and args.routes not in label:
+            continue
+        result = measure(client, label, factory, args.requests)
+        results.append(result)
+        print('{route:<28} {p50_ms:>9.2f} {p95_ms:>9.2f} {p99_ms:>9.2f} {rps:>9.1f} {queries:>8}  {statuses}'.format(
+            **dict(result, queries='-' if result['queries'] is None else '{:.1f}'.format(result['queries']))))
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump({'commit': git_commit(),
+                       'database': database.split(':', 1)[0],
+                       'dataset': {'venues': args.venues, 'artists': args.artists, 'shows': args.shows, 'seed': args.seed},
+                       'page_cache': not args.no_page_cache,
+                       'routes': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
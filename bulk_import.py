@@ -0,0 +1,223 @@
+import csv
+import io
+import json
+import os
+import time
+
+from forms import VenueForm, ArtistForm, ShowForm, validate
+from models import db, Venue, Artiste, Show, refresh_show_counters, assign_areas, refresh_area_counts
+from scheduling import double_bookings, booking_error
+
+BATCH_SIZE = 5000
+
+# kind -> (model, form whose validators a row must pass)
+IMPORTS = {
+    'venues': (Venue, VenueForm),
+    'artists': (Artiste, ArtistForm),
+    'shows': (Show, ShowForm),
+}
+
+
+# ----------------------------------------------------------------------------#
+# Reading.
+# ----------------------------------------------------------------------------#
+def parse_json_line(line):
+    """Return (dict, None), or (None, errors) for a line that is not a JSON object."""
+    try:
+        record = json.loads(line)
+    except ValueError as e:
+        return None, {'record': ['Not valid JSON: {}'.format(e)]}
+    if not isinstance(record, dict):
+        return None, {'record': ['Expected a JSON object']}
+    return record, None
+
+
+def read_records(path, file_format=None):
+    """Yield (line number, dict, None) for each record of a CSV or JSONL file, lazily.
+
+    A JSONL line that cannot be parsed is yielded as (line number, None, errors)
+    so it is rejected like a record that fails validation.
+    """
+    if file_format is None:
+        file_format = 'jsonl' if path.endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+    with open(path, newline='', encoding='utf-8') as f:
+        if file_format == 'csv':
+            reader = csv.DictReader(f)
+            for record in reader:
+                yield reader.line_num, record, None
+        else:
+            for line_number, line in enumerate(f, 1):
+                if line.strip():
+                    yield (line_number,) + parse_json_line(line)
+
+
+# ----------------------------------------------------------------------------#
+# Writing.
+# ----------------------------------------------------------------------------#
+def copy_value(value):
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, list):
+        # postgres array literal
+        return '{' + ','.join('"' + item.replace('\\', '\\\\').replace('"', '\\"') + '"' for item in value) + '}'
+    return value
+
+
+def copy_rows(table, rows):
+    columns = list(rows[0].keys())
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(['\\N' if value is None else value for value in map(copy_value, (row[c] for c in columns))])
+    buffer.seek(0)
+    cursor = db.session.connection().connection.cursor()
+    try:
+        cursor.copy_expert('COPY "{}" ({}) FROM STDIN WITH (FORMAT csv, NULL \'\\N\')'.format(
+            table.name, ', '.join('"{}"'.format(c) for c in columns)), buffer)
+    finally:
+        cursor.close()
+
+
+def insert_rows(table, rows):
+    if db.engine.dialect.name == 'postgresql':
+        copy_rows(table, rows)
+    else:
+        db.session.execute(table.insert(), rows)
+
+
+# ----------------------------------------------------------------------------#
+# Checkpoints.
+# ----------------------------------------------------------------------------#
+def checkpoint_path(path):
+    return path + '.checkpoint'
+
+
+def file_signature(path):
+    # a checkpoint only applies to the file it was written for, not a new file saved at the same path
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def load_checkpoint(path):
+    """Records already imported from `path`, or 0 when there is no checkpoint for this version of it."""
+    try:
+        with open(checkpoint_path(path)) as f:
+            checkpoint = json.load(f)
+        if checkpoint.get('file') != file_signature(path):
+            return 0
+        return checkpoint['records']
+    except (IOError, ValueError, KeyError):
+        return 0
+
+
+def save_checkpoint(path, records):
+    tmp = checkpoint_path(path) + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump({'records': records, 'file': file_signature(path)}, f)
+    os.replace(tmp, checkpoint_path(path))
+
+
+def remove_checkpoint(path):
+    try:
+        os.remove(checkpoint_path(path))
+    except OSError:
+        pass
+
+
+# ----------------------------------------------------------------------------#
+# Import.
+# ----------------------------------------------------------------------------#
+def import_file(kind, path, file_format=None, batch_size=BATCH_SIZE, resume=True, echo=print):
+    """Stream `path` into the table for `kind`, one committed batch at a time.
+
+    Only one batch is held in memory. After each commit the number of records
+    consumed is written to `<path>.checkpoint`, so a rerun of an interrupted
+    import skips them; the checkpoint is removed once the whole file is in, and
+    ignored if the file has changed since. Returns (imported, rejected).
+    """
+    model, form_class = IMPORTS[kind]
+    table = model.__table__
+    skip = load_checkpoint(path) if resume else 0
+    if skip:
+        echo('Resuming {} after {} records'.format(path, skip))
+    elif resume and os.path.exists(checkpoint_path(path)):
+        echo('Ignoring {}: {} has changed since it was written'.format(checkpoint_path(path), path))
+
+    valid_ids = {}
+    if kind == 'shows':
+        valid_ids['venue_id'] = set(row.id for row in db.session.query(Venue.id))
+        valid_ids['artiste_id'] = set(row.id for row in db.session.query(Artiste.id))
+
+    imported = rejected = 0
+    consumed = skip
+    batch = []
+    lines = []
+    started = time.time()
+
+    def reject_double_bookings():
+        # one overlapping show would otherwise fail the exclusion constraint and the whole batch
+        nonlocal imported, rejected
+        clashes = double_bookings(batch)
+        for position in sorted(clashes, key=lambda position: lines[position]):
+            echo('line {}: {}'.format(lines[position], {'start_time': [
+                booking_error(batch[position]['venue_id'], clashes[position])]}))
+        for position in sorted(clashes, reverse=True):
+            del batch[position]
+            del lines[position]
+        imported -= len(clashes)
+        rejected += len(clashes)
+
+    def flush():
+        if kind == 'shows':
+            reject_double_bookings()
+        if batch:
+            insert_rows(table, batch)
+            if kind == 'shows':
+                # COPY/executemany bypass the ORM events that maintain the counters
+                refresh_show_counters(venue_ids=set(row['venue_id'] for row in batch),
+                                      artist_ids=set(row['artiste_id'] for row in batch))
+            else:
+                # likewise the events that set area_id
+                assign_areas(model)
+                if kind == 'venues':
+                    refresh_area_counts()
+        db.session.commit()
+        save_checkpoint(path, consumed)
+        del batch[:]
+        del lines[:]
+        elapsed = time.time() - started
+        echo('{}: {} imported, {} rejected, {:.0f} rows/s'.format(
+            kind, imported, rejected, imported / elapsed if elapsed else 0))
+
+    for position, (line_number, record, errors) in enumerate(read_records(path, file_format)):
+        if position < skip:
+            continue
+        row = None
+        if record is not None:
+            row, errors = validate(form_class, record)
+        if row is not None:
+            for column, ids in valid_ids.items():
+                try:
+                    row[column] = int(row[column])
+                except (TypeError, ValueError):
+                    row[column] = None
+                if row[column] not in ids:
+                    errors = {column: ['No such id: {}'.format(record.get(column))]}
+                    row = None
+                    break
+        consumed += 1
+        if row is None:
+            rejected += 1
+            echo('line {}: {}'.format(line_number, errors))
+        else:
+            batch.append(row)
+            lines.append(line_number)
+            imported += 1
+        if len(batch) >= batch_size:
+            flush()
+
+    flush()
+    remove_checkpoint(path)
+    return imported, rejected
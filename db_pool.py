@@ -0,0 +1,78 @@
+import logging
+import threading
+import time
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool, NullPool
+
+logger = logging.getLogger(__name__)
+
+# checkouts that wait longer than this (seconds) are logged as a warning
+SLOW_CHECKOUT = 0.5
+
+wait_lock = threading.Lock()
+wait_stats = {'checkouts': 0, 'wait_total': 0.0, 'wait_max': 0.0}
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waits for a connection."""
+
+    def _do_get(self):
+        started = time.time()
+        try:
+            return super(TimedQueuePool, self)._do_get()
+        finally:
+            waited = time.time() - started
+            with wait_lock:
+                wait_stats['checkouts'] += 1
+                wait_stats['wait_total'] += waited
+                wait_stats['wait_max'] = max(wait_stats['wait_max'], waited)
+            if waited > SLOW_CHECKOUT:
+                logger.warning('waited %.3fs for a database connection (%s)', waited, self.status())
+
+
+def engine_options(config):
+    """SQLALCHEMY_ENGINE_OPTIONS built from the DB_* settings in config.py."""
+    if not config['SQLALCHEMY_DATABASE_URI'].startswith('postgres'):
+        return {'pool_pre_ping': config['DB_POOL_PRE_PING']}
+
+    if config['DB_POOLER_MODE'] == 'transaction':
+        # the external pooler multiplexes server connections between transactions,
+        # so keep no idle connections here and send no session-level startup options
+        return {'poolclass': NullPool}
+
+    options = {
+        'poolclass': TimedQueuePool,
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+    }
+    if config['DB_STATEMENT_TIMEOUT']:
+        options['connect_args'] = {'options': '-c statement_timeout={}'.format(config['DB_STATEMENT_TIMEOUT'])}
+    return options
+
+
+def set_transaction_timeout(timeout):
+    # pooler mode: apply the statement timeout to each transaction instead of the session
+    @event.listens_for(Engine, 'begin')
+    def begin(connection):
+        if connection.dialect.name == 'postgresql':
+            connection.execute(text('SET LOCAL statement_timeout = {:d}'.format(timeout)))
+
+
+def pool_status(engine):
+    pool = engine.pool
+    with wait_lock:
+        status = dict(wait_stats)
+    status['wait_avg'] = status['wait_total'] / status['checkouts'] if status['checkouts'] else 0.0
+    if isinstance(pool, QueuePool):
+        status.update({'size': pool.size(),
+                       'checked_out': pool.checkedout(),
+                       'idle': pool.checkedin(),
+                       'overflow': max(pool.overflow(), 0)})
+    else:
+        status['pool'] = pool.status()
+    return status
@@ -0,0 +1,49 @@
+from collections import Counter
+
+from flask import url_for
+
+from forms import GENRE_CHOICES
+from models import db
+
+# the canonical vocabulary, in display order
+GENRES = [value for value, label in GENRE_CHOICES]
+
+
+def selected_genres(args):
+    # ?genre=Jazz&genre=Blues; unknown values are ignored
+    requested = set(args.getlist('genre'))
+    return [genre for genre in GENRES if genre in requested]
+
+
+def genre_criteria(model, genres):
+    """Criteria matching rows that have every genre in `genres`."""
+    if not genres:
+        return []
+    if db.engine.dialect.name == 'postgresql':
+        # genres @> ARRAY[...], served by the ix_<table>_genres GIN index
+        return [model.genres.contains(genres)]
+    # JSON text elsewhere; no genre contains a quote, so a quoted match is exact
+    return [db.cast(model.genres, db.Text).like('%"{}"%'.format(genre)) for genre in genres]
+
+
+def genre_facets(model, *criteria):
+    """{genre: number of rows matching `criteria` with that genre}, in one aggregate query."""
+    if db.engine.dialect.name == 'postgresql':
+        rows = db.session.query(db.func.unnest(model.genres).label('genre')).filter(*criteria).subquery()
+        return dict(db.session.query(rows.c.genre, db.func.count()).group_by(rows.c.genre))
+    return Counter(genre for row in db.session.query(model.genres).filter(*criteria)
+                   for genre in set(row.genres or ()))
+
+
+def facet_links(endpoint, counts, selected, **args):
+    """Facet entries for the template: each links to the page with its genre toggled."""
+    facets = []
+    for genre in GENRES:
+        if not counts.get(genre) and genre not in selected:
+            continue
+        toggled = [g for g in selected if g != genre] if genre in selected else selected + [genre]
+        facets.append({'genre': genre,
+                       'count': counts.get(genre, 0),
+                       'selected': genre in selected,
+                       'url': url_for(endpoint, genre=toggled, **args)})
+    return facets
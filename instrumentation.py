@@ -0,0 +1,180 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from flask import g, request, has_app_context, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# histogram bucket upper bounds, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+# WSGI environ key of the QueryStats of work done for a request before Flask saw it
+PREFETCH_STATS = 'fyyur.prefetch_stats'
+# the QueryStats that queries run outside a Flask request count towards, e.g. asgi.py's prefetch
+current_stats = ContextVar('current_stats', default=None)
+
+
+class QueryStats(object):
+    def __init__(self):
+        self.request_started = time.perf_counter()
+        self.query_count = 0
+        self.db_time = 0.0
+
+
+def request_stats():
+    if has_app_context() and 'request_started' in g:
+        return g
+    return current_stats.get()
+
+
+class Histogram(object):
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def prometheus(self, name, labels):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            cumulative += count
+            lines.append('{}_bucket{{{},le="{}"}} {}'.format(name, labels, bound, cumulative))
+        lines.append('{}_sum{{{}}} {}'.format(name, labels, self.sum))
+        lines.append('{}_count{{{}}} {}'.format(name, labels, self.count))
+        return lines
+
+
+def slow_request_logger(app):
+    """A logger writing to SLOW_REQUEST_LOG, in debug mode too.
+
+    app.py only gives app.logger its error.log handler outside debug mode, and
+    config.py turns debug on, so slow requests get a handler of their own.
+    """
+    logger = app.logger.getChild('slow_requests')
+    logger.setLevel(logging.WARNING)
+    handler = logging.FileHandler(app.config.get('SLOW_REQUEST_LOG', 'error.log'))
+    handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s: %(message)s'))
+    logger.addHandler(handler)
+    # outside debug mode app.logger writes error.log too; don't log each request twice
+    logger.propagate = app.debug
+    return logger
+
+
+class RequestMetrics(object):
+    """Per-request query count, DB time, template time and total time.
+
+    Timings are sent back as a Server-Timing header, requests slower than
+    SLOW_REQUEST_MS are logged to SLOW_REQUEST_LOG, and per-endpoint
+    histograms are rendered in Prometheus text format by `prometheus()`.
+    """
+
+    def __init__(self, app=None):
+        self.lock = threading.Lock()
+        self.stats_lock = threading.Lock()
+        self.histograms = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.slow_request = app.config.get('SLOW_REQUEST_MS', 500) / 1000.0
+        self.slow_log = slow_request_logger(app)
+        event.listen(Engine, 'before_cursor_execute', self.before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', self.after_cursor_execute)
+        event.listen(Engine, 'handle_error', self.handle_error)
+        before_render_template.connect(self.before_render, app)
+        template_rendered.connect(self.after_render, app)
+        app.before_request(self.before_request)
+        app.after_request(self.after_request)
+
+    # SQLAlchemy events
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_started'].pop()
+        stats = request_stats()
+        if stats is not None:
+            # concurrent queries may be counting for the same request
+            with self.stats_lock:
+                stats.query_count += 1
+                stats.db_time += elapsed
+
+    def handle_error(self, context):
+        started = context.connection.info.get('query_started') if context.connection is not None else None
+        if started:
+            started.pop()
+
+    # template signals
+    def before_render(self, sender, template, context, **extra):
+        if 'request_started' in g:
+            g.render_started = time.perf_counter()
+
+    def after_render(self, sender, template, context, **extra):
+        if g.get('render_started') is not None:
+            g.render_time += time.perf_counter() - g.render_started
+            g.render_started = None
+
+    # request hooks
+    def before_request(self):
+        # asgi.py may already have run this request's queries, and started its clock
+        prefetch = request.environ.get(PREFETCH_STATS) or QueryStats()
+        g.request_started = prefetch.request_started
+        g.query_count = prefetch.query_count
+        g.db_time = prefetch.db_time
+        g.render_time = 0.0
+        g.render_started = None
+
+    def after_request(self, response):
+        if 'request_started' not in g:
+            return response
+        total = time.perf_counter() - g.request_started
+        response.headers['Server-Timing'] = ', '.join([
+            'db;dur={:.2f};desc="{} queries"'.format(g.db_time * 1000, g.query_count),
+            'tpl;dur={:.2f}'.format(g.render_time * 1000),
+            'total;dur={:.2f}'.format(total * 1000),
+        ])
+        endpoint = request.endpoint or 'unmatched'
+        self.observe(endpoint, total, g.db_time, g.render_time, g.query_count)
+        if total > self.slow_request:
+            self.slow_log.warning('slow request: %s %s %d %.1fms (%d queries, db %.1fms, templates %.1fms)',
+                              request.method, request.full_path, response.status_code, total * 1000,
+                              g.query_count, g.db_time * 1000, g.render_time * 1000)
+        return response
+
+    def observe(self, endpoint, total, db_time, render_time, query_count):
+        with self.lock:
+            if endpoint not in self.histograms:
+                self.histograms[endpoint] = {'request': Histogram(BUCKETS),
+                                             'db': Histogram(BUCKETS),
+                                             'template': Histogram(BUCKETS),
+                                             'queries': Histogram(QUERY_BUCKETS)}
+            histograms = self.histograms[endpoint]
+            histograms['request'].observe(total)
+            histograms['db'].observe(db_time)
+            histograms['template'].observe(render_time)
+            histograms['queries'].observe(query_count)
+
+    def prometheus(self):
+        metrics = (('request', 'fyyur_request_duration_seconds', 'Total request time.'),
+                   ('db', 'fyyur_request_db_seconds', 'Time spent in SQL per request.'),
+                   ('template', 'fyyur_request_template_seconds', 'Time spent rendering templates per request.'),
+                   ('queries', 'fyyur_request_queries', 'SQL statements per request.'))
+        lines = []
+        with self.lock:
+            for key, name, description in metrics:
+                lines.append('# HELP {} {}'.format(name, description))
+                lines.append('# TYPE {} histogram'.format(name))
+                for endpoint in sorted(self.histograms):
+                    lines.extend(self.histograms[endpoint][key].prometheus(name, 'endpoint="{}"'.format(endpoint)))
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,33 @@
+"""trigram and genre indexes for search
+
+Revision ID: 5b1e9c3f7a21
+Revises: 229493a732db
+Create Date: 2026-10-18 09:12:44.318204
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '5b1e9c3f7a21'
+down_revision = '229493a732db'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for table in ('Venue', 'Artiste'):
+        op.create_index('ix_{}_name_trgm'.format(table), table, ['name'],
+                        postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+        op.create_index('ix_{}_city_trgm'.format(table), table, ['city'],
+                        postgresql_using='gin', postgresql_ops={'city': 'gin_trgm_ops'})
+        op.create_index('ix_{}_genres'.format(table), table, ['genres'],
+                        postgresql_using='gin')
+
+
+def downgrade():
+    for table in ('Venue', 'Artiste'):
+        op.drop_index('ix_{}_genres'.format(table), table_name=table)
+        op.drop_index('ix_{}_city_trgm'.format(table), table_name=table)
+        op.drop_index('ix_{}_name_trgm'.format(table), table_name=table)
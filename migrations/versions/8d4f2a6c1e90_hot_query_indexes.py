@@ -0,0 +1,43 @@
+"""indexes for the detail, listing and search queries
+
+Revision ID: 8d4f2a6c1e90
+Revises: 5b1e9c3f7a21
+Create Date: 2026-10-18 10:02:17.553912
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '8d4f2a6c1e90'
+down_revision = '5b1e9c3f7a21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # show_venue / show_artist: shows of one venue or artist, split by start_time
+    op.create_index('ix_Show_venue_id_start_time', 'Show', ['venue_id', 'start_time'])
+    op.create_index('ix_Show_artiste_id_start_time', 'Show', ['artiste_id', 'start_time'])
+    # /shows keyset pagination
+    op.create_index('ix_Show_start_time_id', 'Show', ['start_time', 'id'])
+    # /venues area listing
+    op.create_index('ix_Venue_state_city', 'Venue', ['state', 'city'])
+    # /artists keyset pagination and name lookups
+    op.create_index('ix_Artiste_name_id', 'Artiste', ['name', 'id'])
+    op.create_index('ix_Venue_name_id', 'Venue', ['name', 'id'])
+    # search matches a whole state with ILIKE
+    for table in ('Venue', 'Artiste'):
+        op.create_index('ix_{}_state_trgm'.format(table), table, ['state'],
+                        postgresql_using='gin', postgresql_ops={'state': 'gin_trgm_ops'})
+
+
+def downgrade():
+    for table in ('Venue', 'Artiste'):
+        op.drop_index('ix_{}_state_trgm'.format(table), table_name=table)
+    op.drop_index('ix_Venue_name_id', table_name='Venue')
+    op.drop_index('ix_Artiste_name_id', table_name='Artiste')
+    op.drop_index('ix_Venue_state_city', table_name='Venue')
+    op.drop_index('ix_Show_start_time_id', table_name='Show')
+    op.drop_index('ix_Show_artiste_id_start_time', table_name='Show')
+    op.drop_index('ix_Show_venue_id_start_time', table_name='Show')
@@ -0,0 +1,75 @@
+"""Area table with normalized city/state keys, backfilled from Venue and Artiste
+
+Revision ID: a6c2e8f41d39
+Revises: f3b9d6e21a57
+Create Date: 2026-10-18 15:31:07.294418
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a6c2e8f41d39'
+down_revision = 'f3b9d6e21a57'
+branch_labels = None
+depends_on = None
+
+
+# same normalization as models.area_key, frozen here for this migration
+def clean_city(city):
+    return ' '.join((city or '').split())
+
+
+def area_key(city, state):
+    return '{}|{}'.format((state or '').strip().upper(), clean_city(city).lower())
+
+
+def upgrade():
+    areas = op.create_table('Area',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('key', sa.String(length=250), nullable=False),
+    sa.Column('city', sa.String(length=120), nullable=False),
+    sa.Column('state', sa.String(length=120), nullable=False),
+    sa.Column('venues_count', sa.Integer(), server_default='0', nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('key')
+    )
+    op.create_index('ix_Area_state_city', 'Area', ['state', 'city'])
+    for table in ('Venue', 'Artiste'):
+        op.add_column(table, sa.Column('area_id', sa.Integer(), nullable=True))
+        op.create_foreign_key('{}_area_id_fkey'.format(table), table, 'Area', ['area_id'], ['id'])
+        op.create_index('ix_{}_area_id'.format(table), table, ['area_id'])
+
+    # one Area per normalized key, displayed with its first spelling in sort
+    # order, which prefers capitalized forms ("San Francisco" < "san francisco")
+    connection = op.get_bind()
+    pairs = set()
+    for table in ('Venue', 'Artiste'):
+        pairs.update(tuple(row) for row in connection.execute(
+            sa.text('SELECT DISTINCT city, state FROM "{}"'.format(table))))
+    spellings = {}
+    for city, state in sorted(pairs, key=lambda pair: (clean_city(pair[0]), (pair[1] or '').strip().upper())):
+        spellings.setdefault(area_key(city, state), (clean_city(city), (state or '').strip().upper()))
+    if spellings:
+        op.bulk_insert(areas, [{'key': key, 'city': city, 'state': state}
+                               for key, (city, state) in sorted(spellings.items())])
+    ids = dict((row.key, row.id) for row in connection.execute(sa.text('SELECT id, key FROM "Area"')))
+    for table in ('Venue', 'Artiste'):
+        for city, state in pairs:
+            connection.execute(
+                sa.text('UPDATE "{}" SET area_id = :area_id WHERE city IS NOT DISTINCT FROM :city '
+                        'AND state IS NOT DISTINCT FROM :state'.format(table)),
+                {'area_id': ids[area_key(city, state)], 'city': city, 'state': state})
+    op.execute('UPDATE "Area" SET venues_count = (SELECT count(*) FROM "Venue" WHERE "Venue".area_id = "Area".id)')
+    op.drop_index('ix_Venue_state_city', table_name='Venue')
+
+
+def downgrade():
+    op.create_index('ix_Venue_state_city', 'Venue', ['state', 'city'])
+    for table in ('Artiste', 'Venue'):
+        op.drop_index('ix_{}_area_id'.format(table), table_name=table)
+        op.drop_constraint('{}_area_id_fkey'.format(table), table, type_='foreignkey')
+        op.drop_column(table, 'area_id')
+    op.drop_index('ix_Area_state_city', table_name='Area')
+    op.drop_table('Area')
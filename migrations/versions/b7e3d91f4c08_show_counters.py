@@ -0,0 +1,38 @@
+"""denormalized show counters on Venue and Artiste
+
+Revision ID: b7e3d91f4c08
+Revises: 8d4f2a6c1e90
+Create Date: 2026-10-18 11:20:05.902341
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e3d91f4c08'
+down_revision = '8d4f2a6c1e90'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table, owner in (('Venue', 'venue_id'), ('Artiste', 'artiste_id')):
+        op.add_column(table, sa.Column('upcoming_shows_count', sa.Integer(), server_default='0', nullable=False))
+        op.add_column(table, sa.Column('past_shows_count', sa.Integer(), server_default='0', nullable=False))
+        op.add_column(table, sa.Column('next_show_time', sa.DateTime(), nullable=True))
+        op.create_index('ix_{}_next_show_time'.format(table), table, ['next_show_time'])
+        op.execute('''
+            UPDATE "{0}" SET
+                upcoming_shows_count = (SELECT count(*) FROM "Show" WHERE "Show".{1} = "{0}".id AND start_time >= now()),
+                past_shows_count = (SELECT count(*) FROM "Show" WHERE "Show".{1} = "{0}".id AND start_time < now()),
+                next_show_time = (SELECT min(start_time) FROM "Show" WHERE "Show".{1} = "{0}".id AND start_time >= now())
+        '''.format(table, owner))
+
+
+def downgrade():
+    for table in ('Venue', 'Artiste'):
+        op.drop_index('ix_{}_next_show_time'.format(table), table_name=table)
+        op.drop_column(table, 'next_show_time')
+        op.drop_column(table, 'past_shows_count')
+        op.drop_column(table, 'upcoming_shows_count')
@@ -0,0 +1,36 @@
+"""ShowArchive table for past shows
+
+Revision ID: c41a8e2b95d3
+Revises: b7e3d91f4c08
+Create Date: 2026-10-18 12:05:48.117630
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c41a8e2b95d3'
+down_revision = 'b7e3d91f4c08'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('ShowArchive',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('artiste_id', sa.Integer(), nullable=False),
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('start_time', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['artiste_id'], ['Artiste.id'], ),
+    sa.ForeignKeyConstraint(['venue_id'], ['Venue.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_ShowArchive_venue_id_start_time', 'ShowArchive', ['venue_id', 'start_time'])
+    op.create_index('ix_ShowArchive_artiste_id_start_time', 'ShowArchive', ['artiste_id', 'start_time'])
+
+
+def downgrade():
+    op.drop_index('ix_ShowArchive_artiste_id_start_time', table_name='ShowArchive')
+    op.drop_index('ix_ShowArchive_venue_id_start_time', table_name='ShowArchive')
+    op.drop_table('ShowArchive')
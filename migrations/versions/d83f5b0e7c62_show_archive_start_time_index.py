@@ -0,0 +1,24 @@
+"""ShowArchive (start_time, id) index
+
+Revision ID: d83f5b0e7c62
+Revises: a6c2e8f41d39
+Create Date: 2026-10-18 21:14:06.392517
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'd83f5b0e7c62'
+down_revision = 'a6c2e8f41d39'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # /api/v1/shows and the exports merge Show and ShowArchive by (start_time, id)
+    op.create_index('ix_ShowArchive_start_time_id', 'ShowArchive', ['start_time', 'id'])
+
+
+def downgrade():
+    op.drop_index('ix_ShowArchive_start_time_id', table_name='ShowArchive')
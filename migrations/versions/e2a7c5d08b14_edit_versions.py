@@ -0,0 +1,26 @@
+"""version columns for optimistic concurrency on edits
+
+Revision ID: e2a7c5d08b14
+Revises: c41a8e2b95d3
+Create Date: 2026-10-18 13:40:22.506381
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2a7c5d08b14'
+down_revision = 'c41a8e2b95d3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('Venue', 'Artiste'):
+        op.add_column(table, sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade():
+    for table in ('Artiste', 'Venue'):
+        op.drop_column(table, 'version')
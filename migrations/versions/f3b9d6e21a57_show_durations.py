@@ -0,0 +1,65 @@
+"""show durations and no overlapping shows at a venue
+
+Revision ID: f3b9d6e21a57
+Revises: e2a7c5d08b14
+Create Date: 2026-10-18 14:22:51.803164
+
+Existing shows get the default duration, cut short where the next show at
+the same venue starts earlier, so the exclusion constraint can be built.
+Shows less than a minute apart at one venue cannot be separated that way:
+the upgrade stops and lists them, to be moved or deleted by hand first.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3b9d6e21a57'
+down_revision = 'e2a7c5d08b14'
+branch_labels = None
+depends_on = None
+
+# each show with the start of the next one at its venue
+NEXT_SHOWS = '''
+    SELECT id, venue_id, start_time,
+           LEAD(id) OVER (PARTITION BY venue_id ORDER BY start_time, id) AS next_id,
+           LEAD(start_time) OVER (PARTITION BY venue_id ORDER BY start_time, id) AS next_start
+    FROM "Show" WHERE start_time IS NOT NULL
+'''
+
+
+def upgrade():
+    op.add_column('Show', sa.Column('duration', sa.Integer(), server_default='120', nullable=False))
+    op.add_column('ShowArchive', sa.Column('duration', sa.Integer(), server_default='120', nullable=False))
+
+    conn = op.get_bind()
+    clashes = conn.execute(sa.text(
+        'SELECT venue_id, id, next_id, start_time FROM ({}) shows '
+        "WHERE next_start < start_time + interval '1 minute' ORDER BY venue_id, start_time".format(NEXT_SHOWS)
+    )).fetchall()
+    if clashes:
+        raise RuntimeError('Shows less than a minute apart at the same venue; move or delete one of each pair '
+                           'and rerun the upgrade:\n' + '\n'.join(
+                               'venue {}: shows {} and {} at {}'.format(*clash) for clash in clashes))
+    # end each show by the time the next one at its venue starts
+    conn.execute(sa.text('''
+        UPDATE "Show" SET duration = floor(extract(epoch FROM shows.next_start - shows.start_time) / 60)
+        FROM ({}) shows
+        WHERE "Show".id = shows.id
+          AND shows.next_start < shows.start_time + "Show".duration * interval '1 minute'
+    '''.format(NEXT_SHOWS)))
+
+    # btree_gist lets the GiST index combine venue_id equality with range overlap
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    op.execute('''
+        ALTER TABLE "Show" ADD CONSTRAINT "Show_venue_id_no_overlap"
+        EXCLUDE USING gist (venue_id WITH =,
+                            tsrange(start_time, start_time + duration * interval '1 minute') WITH &&)
+        WHERE (start_time IS NOT NULL)
+    ''')
+
+
+def downgrade():
+    op.drop_constraint('Show_venue_id_no_overlap', 'Show')
+    op.drop_column('ShowArchive', 'duration')
+    op.drop_column('Show', 'duration')
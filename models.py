@@ -1,6 +1,46 @@
-from flask_sqlalchemy import SQLAlchemy
+from datetime import datetime
 
-db = SQLAlchemy()
+import dateutil.parser
+from sqlalchemy import DDL, event
+from sqlalchemy.orm import validates
+from sqlalchemy.orm.attributes import get_history
+
+from replica import RoutingSQLAlchemy
+
+# reads of GET requests can be routed to a replica; see replica.py
+db = RoutingSQLAlchemy()
+
+# show lengths in minutes
+DEFAULT_SHOW_DURATION = 120
+MAX_SHOW_DURATION = 24 * 60
+
+# ARRAY on PostgreSQL; JSON on SQLite so the app can run against a local file database
+Genres = db.ARRAY(db.String(120)).with_variant(db.JSON(), 'sqlite')
+
+# the trigram indexes below need pg_trgm; the migrations create it too
+event.listen(db.metadata, 'before_create',
+             DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql'))
+
+
+def search_indexes(table):
+    # trigram and GIN indexes behind search.postgres_search_query
+    indexes = [db.Index('ix_{}_{}_trgm'.format(table, column), column,
+                        postgresql_using='gin', postgresql_ops={column: 'gin_trgm_ops'})
+               for column in ('name', 'city', 'state')]
+    indexes.append(db.Index('ix_{}_genres'.format(table), 'genres', postgresql_using='gin'))
+    return tuple(indexes)
+
+
+class Area(db.Model):
+    # one row per normalized (city, state); see area_key
+    __tablename__ = 'Area'
+
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(250), nullable=False, unique=True)
+    city = db.Column(db.String(120), nullable=False)
+    state = db.Column(db.String(120), nullable=False)
+    venues_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    __table_args__ = (db.Index('ix_Area_state_city', 'state', 'city'),)
 
 
 class Venue(db.Model):
@@ -17,8 +57,18 @@ class Venue(db.Model):
     seeking_talent = db.Column(db.Boolean, nullable=False, default=False)
     seeking_description = db.Column(db.String(120))
     website = db.Column(db.String(120))
-    genres = db.Column(db.ARRAY(db.String(120)))
+    genres = db.Column(Genres)
+    area_id = db.Column(db.Integer, db.ForeignKey('Area.id'), index=True)
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    next_show_time = db.Column(db.DateTime, index=True)
+    # bumped by every edit; see update_versioned
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
     shows = db.relationship('Show', backref='venue', lazy=True)
+    # AUTOINCREMENT: SQLite would otherwise hand a deleted row's id to the next insert,
+    # and fragment cache keys (id, version) must never name two different rows
+    __table_args__ = search_indexes('Venue') + (db.Index('ix_Venue_name_id', 'name', 'id'),
+                                              {'sqlite_autoincrement': True})
 
 
 class Artiste(db.Model):
@@ -29,13 +79,22 @@ class Artiste(db.Model):
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
     phone = db.Column(db.String(120))
-    genres = db.Column(db.ARRAY(db.String(120)))
+    genres = db.Column(Genres)
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
     seeking_venue = db.Column(db.Boolean, nullable=False, default=False)
     seeking_description = db.Column(db.String(120))
     website = db.Column(db.String(120))
+    area_id = db.Column(db.Integer, db.ForeignKey('Area.id'), index=True)
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    next_show_time = db.Column(db.DateTime, index=True)
+    # bumped by every edit; see update_versioned
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
     shows = db.relationship('Show', backref='artiste', lazy=True)
+    # no id reuse on SQLite either, as for Venue
+    __table_args__ = search_indexes('Artiste') + (db.Index('ix_Artiste_name_id', 'name', 'id'),
+                                              {'sqlite_autoincrement': True})
 
 
 class Show(db.Model):
@@ -44,3 +103,256 @@ class Show(db.Model):
     artiste_id = db.Column(db.Integer, db.ForeignKey('Artiste.id'), nullable=False)
     venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False)
     start_time = db.Column(db.DateTime)
+    # minutes; on PostgreSQL an exclusion constraint keeps a venue's shows from overlapping
+    duration = db.Column(db.Integer, nullable=False, default=DEFAULT_SHOW_DURATION,
+                         server_default=str(DEFAULT_SHOW_DURATION))
+    # detail pages and scheduling read one venue's or artist's shows by time; /shows pages by (start_time, id)
+    __table_args__ = (db.Index('ix_Show_venue_id_start_time', 'venue_id', 'start_time'),
+                      db.Index('ix_Show_artiste_id_start_time', 'artiste_id', 'start_time'),
+                      db.Index('ix_Show_start_time_id', 'start_time', 'id'))
+
+    @validates('start_time')
+    def parse_start_time(self, key, value):
+        # form posts carry strings; the show counters compare start_time with datetime.now()
+        return dateutil.parser.parse(value) if isinstance(value, str) else value
+
+
+class ShowArchive(db.Model):
+    # past shows moved out of Show by `flask archive-shows`
+    __tablename__ = 'ShowArchive'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    artiste_id = db.Column(db.Integer, db.ForeignKey('Artiste.id'), nullable=False)
+    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False)
+    start_time = db.Column(db.DateTime)
+    duration = db.Column(db.Integer, nullable=False, default=DEFAULT_SHOW_DURATION,
+                         server_default=str(DEFAULT_SHOW_DURATION))
+    # the API and exports page through Show and ShowArchive together by (start_time, id)
+    __table_args__ = (db.Index('ix_ShowArchive_venue_id_start_time', 'venue_id', 'start_time'),
+                      db.Index('ix_ShowArchive_artiste_id_start_time', 'artiste_id', 'start_time'),
+                      db.Index('ix_ShowArchive_start_time_id', 'start_time', 'id'))
+
+
+# ----------------------------------------------------------------------------#
+# Areas.
+# ----------------------------------------------------------------------------#
+# Venue/Artiste.area_id follows city/state: ORM inserts and updates set it
+# through the events below, the edit views through area_id_for, and bulk loads
+# through assign_areas. Area.venues_count is recomputed by refresh_area_counts.
+
+# area key -> Area.id, for areas seen committed; areas are never deleted
+area_id_cache = {}
+
+
+def clean_city(city):
+    return ' '.join((city or '').split())
+
+
+def area_key(city, state):
+    # "San Francisco", "san francisco " and "SAN  FRANCISCO" are one area
+    return '{}|{}'.format((state or '').strip().upper(), clean_city(city).lower())
+
+
+def area_id_for(connection, city, state):
+    """Id of the Area for (city, state), created if needed."""
+    key = area_key(city, state)
+    if key in area_id_cache:
+        return area_id_cache[key]
+    table = Area.__table__
+    values = {'key': key, 'city': clean_city(city), 'state': (state or '').strip().upper()}
+    if connection.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+        row = connection.execute(insert(table).values(**values)
+                                 .on_conflict_do_nothing(index_elements=['key'])
+                                 .returning(table.c.id)).first()
+        if row is not None:
+            # created by this transaction: not cached, it may yet roll back
+            return row.id
+    row = connection.execute(db.select([table.c.id]).where(table.c.key == key)).first()
+    if row is None:
+        return connection.execute(table.insert().values(**values)).inserted_primary_key[0]
+    area_id_cache[key] = row.id
+    return row.id
+
+
+def area_count_statement(area_ids=None):
+    # only areas whose count is off are written
+    areas = Area.__table__
+    venues = Venue.__table__
+    count = db.select([db.func.count()]).where(venues.c.area_id == areas.c.id).as_scalar()
+    statement = areas.update().values(venues_count=count).where(areas.c.venues_count != count)
+    if area_ids is not None:
+        statement = statement.where(areas.c.id.in_(list(area_ids)))
+    return statement
+
+
+def refresh_area_counts(area_ids=None):
+    """Recompute Area.venues_count, for all areas or only the given ids; the caller commits."""
+    if area_ids is not None and not area_ids:
+        return 0
+    return db.session.execute(area_count_statement(area_ids)).rowcount
+
+
+def assign_areas(model):
+    """Set area_id on `model` rows that have none, e.g. after a COPY; the caller commits."""
+    table = model.__table__
+    connection = db.session.connection()
+    pairs = db.session.query(model.city, model.state).filter(model.area_id.is_(None)).distinct().all()
+    for city, state in pairs:
+        db.session.execute(table.update()
+                           .where(table.c.area_id.is_(None))
+                           .where(table.c.city.is_(None) if city is None else table.c.city == city)
+                           .where(table.c.state.is_(None) if state is None else table.c.state == state)
+                           .values(area_id=area_id_for(connection, city, state)))
+    return len(pairs)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def forget_area_ids(session):
+    # a rolled-back transaction may have cached an area it created itself
+    area_id_cache.clear()
+
+
+@event.listens_for(Venue, 'before_insert')
+@event.listens_for(Venue, 'before_update')
+@event.listens_for(Artiste, 'before_insert')
+@event.listens_for(Artiste, 'before_update')
+def set_area(mapper, connection, target):
+    target.area_id = area_id_for(connection, target.city, target.state)
+
+
+@event.listens_for(Venue, 'after_insert')
+@event.listens_for(Venue, 'after_delete')
+def count_area_venues(mapper, connection, venue):
+    connection.execute(area_count_statement([venue.area_id]))
+
+
+@event.listens_for(Venue, 'after_update')
+def recount_area_venues(mapper, connection, venue):
+    # only the area the venue left and the one it joined change
+    history = get_history(venue, 'area_id')
+    if not history.added:
+        return
+    # without the old value (never loaded) any area may have lost the venue
+    area_ids = list(history.added) + list(history.deleted) if history.deleted else None
+    connection.execute(area_count_statement(area_ids))
+
+
+# ----------------------------------------------------------------------------#
+# Edits.
+# ----------------------------------------------------------------------------#
+def update_versioned(model, item_id, version, values):
+    """UPDATE one Venue or Artiste row only if it is still at `version`.
+
+    One statement, no row lock held between the edit form and the save.
+    Returns the new version, or None when the row is gone or someone else
+    saved it since `version` was read. The caller commits.
+    """
+    table = model.__table__
+    statement = versioned_update(table, item_id, version, values)
+    if db.engine.dialect.name == 'postgresql':
+        row = db.session.execute(statement.returning(table.c.version)).first()
+        return row.version if row is not None else None
+    return version + 1 if db.session.execute(statement).rowcount == 1 else None
+
+
+def versioned_update(table, item_id, version, values):
+    return table.update() \
+        .where(table.c.id == item_id) \
+        .where(table.c.version == version) \
+        .values(dict(values, version=table.c.version + 1))
+
+
+def update_venue_versioned(venue_id, version, values):
+    """update_versioned for a Venue, also recounting the areas it left and joined.
+
+    On PostgreSQL the UPDATE itself returns the old area_id; elsewhere
+    area_count_statement finds and fixes the counts that are off.
+    """
+    if db.engine.dialect.name != 'postgresql':
+        new_version = update_versioned(Venue, venue_id, version, values)
+        if new_version is not None:
+            refresh_area_counts()
+        return new_version
+    table = Venue.__table__
+    # joined to itself, the row is read as it was before this statement
+    old = table.alias('old')
+    statement = versioned_update(table, venue_id, version, values) \
+        .where(old.c.id == table.c.id) \
+        .returning(table.c.version, old.c.area_id)
+    row = db.session.execute(statement).first()
+    if row is None:
+        return None
+    if row.area_id != values['area_id']:
+        refresh_area_counts([row.area_id, values['area_id']])
+    return row.version
+
+
+# ----------------------------------------------------------------------------#
+# Show counters.
+# ----------------------------------------------------------------------------#
+# Venue/Artiste.upcoming_shows_count, past_shows_count and next_show_time are
+# kept in step with Show inserts and deletes made through the ORM, in the same
+# transaction. Bulk loads and the passing of time are handled by
+# refresh_show_counters, which recomputes them from the Show table.
+def show_owners(show):
+    return ((Venue.__table__, show.venue_id), (Artiste.__table__, show.artiste_id))
+
+
+@event.listens_for(Show, 'after_insert')
+def count_inserted_show(mapper, connection, show):
+    for table, owner_id in show_owners(show):
+        if show.start_time is not None and show.start_time >= datetime.now():
+            values = {'upcoming_shows_count': table.c.upcoming_shows_count + 1,
+                      'next_show_time': db.case([(db.or_(table.c.next_show_time.is_(None),
+                                                         table.c.next_show_time > show.start_time),
+                                                  show.start_time)],
+                                                else_=table.c.next_show_time)}
+        else:
+            values = {'past_shows_count': table.c.past_shows_count + 1}
+        connection.execute(table.update().where(table.c.id == owner_id).values(**values))
+
+
+@event.listens_for(Show, 'after_delete')
+def count_deleted_show(mapper, connection, show):
+    for table, owner_id in show_owners(show):
+        connection.execute(table.update().where(table.c.id == owner_id)
+                           .values(**show_counter_values(table, datetime.now())))
+
+
+def show_counter_values(table, now):
+    # correlated subqueries recomputing one row's counters from Show and ShowArchive
+    shows = Show.__table__
+    archive = ShowArchive.__table__
+    owner_column = 'venue_id' if table is Venue.__table__ else 'artiste_id'
+    owner = shows.c[owner_column]
+    return {
+        'upcoming_shows_count': db.select([db.func.count()]).where(
+            db.and_(owner == table.c.id, shows.c.start_time >= now)).as_scalar(),
+        'past_shows_count': db.select([db.func.count()]).where(
+            db.and_(owner == table.c.id, shows.c.start_time < now)).as_scalar() +
+        db.select([db.func.count()]).where(archive.c[owner_column] == table.c.id).as_scalar(),
+        'next_show_time': db.select([db.func.min(shows.c.start_time)]).where(
+            db.and_(owner == table.c.id, shows.c.start_time >= now)).as_scalar(),
+    }
+
+
+def refresh_show_counters(venue_ids=None, artist_ids=None, now=None, stale_only=False):
+    """Recompute show counters, for all rows or only the given ids.
+
+    With stale_only, only rows whose next show has already started are
+    touched: the roll-forward that moves shows from upcoming to past.
+    Returns the number of rows updated; the caller commits.
+    """
+    if now is None:
+        now = datetime.now()
+    updated = 0
+    for table, ids in ((Venue.__table__, venue_ids), (Artiste.__table__, artist_ids)):
+        statement = table.update().values(**show_counter_values(table, now))
+        if ids is not None:
+            if not ids:
+                continue
+            statement = statement.where(table.c.id.in_(list(ids)))
+        if stale_only:
+            statement = statement.where(table.c.next_show_time < now)
+        updated += db.session.execute(statement).rowcount
+    return updated
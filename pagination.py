@@ -0,0 +1,74 @@
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import tuple_
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+# ----------------------------------------------------------------------------#
+# Cursors.
+# ----------------------------------------------------------------------------#
+def encode_cursor(values):
+    values = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    token = base64.urlsafe_b64encode(json.dumps(values, separators=(',', ':')).encode('utf-8'))
+    return token.decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, keys):
+    # returns None for anything that is not a cursor produced by encode_cursor
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+        if not isinstance(values, list) or len(values) != len(keys):
+            return None
+        return [datetime.fromisoformat(value) if key.type.python_type is datetime and value is not None
+                else value for key, value in zip(keys, values)]
+    except (ValueError, TypeError, NotImplementedError):
+        return None
+
+
+# ----------------------------------------------------------------------------#
+# Keyset pagination.
+# ----------------------------------------------------------------------------#
+def keyset_query(query, keys, after=None, before=None):
+    # `after`/`before` are decoded cursor values
+    if before is not None:
+        return query.filter(tuple_(*keys) < tuple_(*before)) \
+            .order_by(*[key.desc() for key in keys])
+    if after is not None:
+        query = query.filter(tuple_(*keys) > tuple_(*after))
+    return query.order_by(*keys)
+
+
+def keyset_page(query, keys, after=None, before=None, per_page=PAGE_SIZE):
+    """Fetch one page of `query` ordered by the unique column tuple `keys`.
+
+    `after`/`before` are cursors taken from a previous page's `next`/`prev`.
+    The cursor becomes a row-value comparison against the ordering index, so
+    a deep page costs the same as the first one.
+    """
+    per_page = max(1, min(per_page or PAGE_SIZE, MAX_PAGE_SIZE))
+    after = decode_cursor(after, keys) if after else None
+    before = decode_cursor(before, keys) if before else None
+
+    rows = keyset_query(query, keys, after, before).limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if before is not None:
+        rows.reverse()
+
+    def cursor_for(row):
+        return encode_cursor([getattr(row, key.key) for key in keys])
+
+    page = {'items': rows, 'next': None, 'prev': None}
+    if rows:
+        if before is not None:
+            page['prev'] = cursor_for(rows[0]) if has_more else None
+            page['next'] = cursor_for(rows[-1])
+        else:
+            page['next'] = cursor_for(rows[-1]) if has_more else None
+            page['prev'] = cursor_for(rows[0]) if after is not None else None
+    return page
@@ -0,0 +1,41 @@
+from sqlalchemy import text
+
+from models import db
+
+
+def explain(query):
+    # EXPLAIN (FORMAT JSON) the statement `query` would run, with its bound parameters
+    compiled = query.statement.compile(dialect=db.engine.dialect)
+    connection = db.session.connection()
+    execute = getattr(connection, 'exec_driver_sql', connection.execute)
+    return execute('EXPLAIN (FORMAT JSON) ' + str(compiled), compiled.params).scalar()
+
+
+def plan_nodes(plan):
+    yield plan
+    for child in plan.get('Plans', ()):
+        for node in plan_nodes(child):
+            yield node
+
+
+def sequential_scans(query):
+    plan = explain(query)[0]['Plan']
+    return [node['Relation Name'] for node in plan_nodes(plan) if node['Node Type'] == 'Seq Scan']
+
+
+def check_query_plans(queries):
+    """Return {label: [tables]} for every query whose plan scans a table sequentially.
+
+    Sequential scans are disabled for the check, so the planner only picks
+    one when no index can serve the query, regardless of table size.
+    """
+    failures = {}
+    try:
+        db.session.execute(text('SET LOCAL enable_seqscan = off'))
+        for label, query in queries:
+            tables = sequential_scans(query)
+            if tables:
+                failures[label] = tables
+    finally:
+        db.session.rollback()
+    return failures
@@ -0,0 +1,89 @@
+import time
+
+from flask import g, has_request_context, request
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import event, orm
+
+# bind key of the replica in SQLALCHEMY_BINDS
+REPLICA = 'replica'
+# cookie holding the time until which a user who just wrote reads from the primary;
+# a plain cookie, so it holds across workers and restarts whatever SECRET_KEY is
+PRIMARY_UNTIL_COOKIE = 'primary_until'
+
+# wall-clock time of the last commit with writes in this process
+last_write = [0.0]
+
+
+class RoutingSession(SignallingSession):
+    """Session that sends the reads of replica-routed requests to the replica bind.
+
+    Flushes, and every query outside such a request (CLI commands, POSTs,
+    requests just after a write), keep going to the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None):
+        if not self._flushing and has_request_context() and g.get('read_replica'):
+            return self.app.extensions['sqlalchemy'].db.get_engine(self.app, bind=REPLICA)
+        return super(RoutingSession, self).get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+def primary_only(view):
+    # for GET views that write, or that must see the latest row (edit forms)
+    view.primary_only = True
+    return view
+
+
+def init_app(app, db):
+    if not has_replica(app):
+        return
+    lag = app.config['REPLICA_MAX_LAG']
+
+    @event.listens_for(db.session, 'after_commit')
+    def after_commit(sess):
+        # views only commit after writing, including Core UPDATEs that never flush
+        if has_request_context():
+            g.wrote = True
+            last_write[0] = time.time()
+
+    @app.before_request
+    def route_reads():
+        g.read_replica = reads_from_replica(app, request.method, request.endpoint,
+                                            request.cookies.get(PRIMARY_UNTIL_COOKIE, type=float), time.time())
+
+    @app.after_request
+    def remember_write(response):
+        if g.get('wrote'):
+            response.set_cookie(PRIMARY_UNTIL_COOKIE, '{:.3f}'.format(time.time() + lag), max_age=lag,
+                                httponly=True, samesite='Lax')
+        return response
+
+
+def has_replica(app):
+    return bool(app.config.get('SQLALCHEMY_BINDS', {}).get(REPLICA))
+
+
+def reads_from_replica(app, method, endpoint, primary_until, now):
+    """Whether a request's reads may go to the replica.
+
+    `primary_until` is the request's PRIMARY_UNTIL_COOKIE as a float, or None.
+    Read-your-writes: a user's own writes, and pages the page cache would
+    otherwise fill from a replica that has not caught up yet, read the primary.
+    """
+    if not has_replica(app):
+        return False
+    lag = app.config['REPLICA_MAX_LAG']
+    view = app.view_functions.get(endpoint)
+    return (method in ('GET', 'HEAD')
+            and not getattr(view, 'primary_only', False)
+            and not pinned_to_primary(primary_until, now, lag)
+            and last_write[0] + lag <= now)
+
+
+def pinned_to_primary(until, now, lag):
+    # the cookie is unsigned: a value further out than `lag` was not set by us and is ignored
+    return until is not None and now < until <= now + lag
@@ -0,0 +1,141 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from functools import wraps
+
+from flask import g, request, session, make_response
+
+
+class ResponseCache(object):
+    """LRU of rendered pages bounded by total body size, with invalidation tags.
+
+    Each entry records the tags (e.g. 'venue:3', 'shows') of the rows it was
+    rendered from; `invalidate` evicts every entry carrying any given tag.
+    Invalidation only reaches this process, so entries also expire after
+    `max_age` seconds: writes made by other workers or by CLI commands
+    (`flask import`, `flask archive-shows`) show up within that time.
+    Safe to share between the threads of a worker.
+    """
+
+    def __init__(self, max_bytes, max_age=None):
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.size = 0
+        self.entries = OrderedDict()
+        self.tagged = defaultdict(set)
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry['expires'] is not None and entry['expires'] <= time.time():
+                self._discard(key)
+                return None
+            self.entries.move_to_end(key)
+            return entry
+
+    def set(self, key, body, mimetype, tags=(), expires=None):
+        now = time.time()
+        if self.max_age:
+            expires = min(expires or now + self.max_age, now + self.max_age)
+        entry = {'body': body,
+                 'mimetype': mimetype,
+                 'etag': hashlib.sha1(body).hexdigest(),
+                 'last_modified': now,
+                 'expires': expires,
+                 'tags': frozenset(tags)}
+        with self.lock:
+            self._discard(key)
+            if len(body) > self.max_bytes:
+                return entry
+            self.entries[key] = entry
+            self.size += len(body)
+            for tag in entry['tags']:
+                self.tagged[tag].add(key)
+            while self.size > self.max_bytes:
+                self._discard(next(iter(self.entries)))
+        return entry
+
+    def discard(self, key):
+        with self.lock:
+            self._discard(key)
+
+    def _discard(self, key):
+        # the caller holds self.lock
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        self.size -= len(entry['body'])
+        for tag in entry['tags']:
+            keys = self.tagged.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.tagged[tag]
+
+    def invalidate(self, *tags):
+        with self.lock:
+            for tag in tags:
+                for key in list(self.tagged.get(tag, ())):
+                    self._discard(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.tagged.clear()
+            self.size = 0
+
+
+def add_cache_tags(*tags):
+    # called from a cached view to record which rows the page depends on
+    if 'cache_tags' in g:
+        g.cache_tags.update(tags)
+
+
+def expire_cached_page_at(when):
+    # called from a cached view when the page changes at a known time, e.g.
+    # when the next upcoming show becomes a past show
+    if 'cache_tags' in g and when is not None:
+        g.cache_expires = min(g.get('cache_expires') or when, when)
+
+
+def conditional_response(entry):
+    response = make_response(entry['body'])
+    response.mimetype = entry['mimetype']
+    response.set_etag(entry['etag'])
+    response.last_modified = int(entry['last_modified'])
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+def cached_page(cache, *tags):
+    """Serve a GET view from `cache`, rendering it only on a miss.
+
+    Requests with pending flash messages bypass the cache, since the layout
+    renders (and consumes) them into the page.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != 'GET' or session.get('_flashes'):
+                return view(*args, **kwargs)
+
+            key = request.full_path
+            entry = cache.get(key)
+            if entry is None:
+                g.cache_tags = set(tags)
+                g.cache_expires = None
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200 or response.direct_passthrough:
+                    return response
+                expires = g.cache_expires.timestamp() if g.cache_expires is not None else None
+                entry = cache.set(key, response.get_data(), response.mimetype, g.cache_tags, expires)
+            return conditional_response(entry)
+
+        return wrapper
+
+    return decorator
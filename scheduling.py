@@ -0,0 +1,153 @@
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import timedelta
+
+from sqlalchemy.exc import IntegrityError
+
+from forms import ShowForm, validate
+from models import db, Venue, Artiste, Show, MAX_SHOW_DURATION, refresh_show_counters
+
+# largest batch accepted by schedule_shows
+MAX_BATCH = 1000
+
+
+def show_end(show):
+    return show['start_time'] + timedelta(minutes=show['duration'])
+
+
+def booked_intervals(earliest, latest, *criteria):
+    """{venue_id: sorted [(start, end)]} of shows that could overlap [earliest, latest).
+
+    One range scan on Show(venue_id, start_time): a show overlapping the
+    window started less than MAX_SHOW_DURATION before it. `criteria` narrow
+    the venues, and may refer to Venue columns.
+    """
+    booked = defaultdict(list)
+    rows = db.session.query(Show.venue_id, Show.start_time, Show.duration) \
+        .join(Venue, Show.venue_id == Venue.id) \
+        .filter(*criteria) \
+        .filter(Show.start_time < latest) \
+        .filter(Show.start_time > earliest - timedelta(minutes=MAX_SHOW_DURATION)) \
+        .order_by(Show.venue_id, Show.start_time)
+    for row in rows:
+        booked[row.venue_id].append((row.start_time, row.start_time + timedelta(minutes=row.duration)))
+    return booked
+
+
+def overlapping(intervals, start, end):
+    """The first interval in sorted `intervals` that overlaps [start, end), or None."""
+    i = bisect_left(intervals, (start, end))
+    if i < len(intervals) and intervals[i][0] < end:
+        return intervals[i]
+    # earlier shows can only reach `start` if they began within MAX_SHOW_DURATION of it
+    earliest = start - timedelta(minutes=MAX_SHOW_DURATION)
+    for j in range(i - 1, -1, -1):
+        if intervals[j][0] <= earliest:
+            break
+        if intervals[j][1] > start:
+            return intervals[j]
+    return None
+
+
+def double_bookings(rows):
+    """{position: (start, end) it clashes with} for the rows of `rows` that cannot be booked.
+
+    `rows` are show dicts with venue_id, start_time and duration. A row clashes
+    with an existing show or with a row of the batch that starts before it;
+    existing shows are read with one range query for the whole batch.
+    """
+    if not rows:
+        return {}
+    booked = booked_intervals(min(row['start_time'] for row in rows),
+                              max(show_end(row) for row in rows),
+                              Show.venue_id.in_(set(row['venue_id'] for row in rows)))
+    clashes = {}
+    # earliest first, so each row is checked against everything booked before it
+    for position in sorted(range(len(rows)), key=lambda i: rows[i]['start_time']):
+        row = rows[position]
+        start, end = row['start_time'], show_end(row)
+        intervals = booked[row['venue_id']]
+        clash = overlapping(intervals, start, end)
+        if clash is None:
+            intervals.insert(bisect_left(intervals, (start, end)), (start, end))
+        else:
+            clashes[position] = clash
+    return clashes
+
+
+def booking_error(venue_id, clash):
+    return 'Venue {} is already booked from {:%Y-%m-%d %H:%M} to {:%H:%M}'.format(venue_id, clash[0], clash[1])
+
+
+def schedule_shows(records):
+    """Validate and insert a batch of shows in one transaction.
+
+    `records` are dicts with artiste_id, venue_id, start_time and an optional
+    duration in minutes. Nothing is inserted unless every row is valid and
+    free: returns (ids, []) on success, or ([], errors) where each error is
+    {'row': index, 'errors': {field: [messages]}}. Double bookings, against
+    existing shows or within the batch, are found with one range query; the
+    exclusion constraint on Show catches any booking made concurrently.
+    """
+    if len(records) > MAX_BATCH:
+        return [], [{'row': None, 'errors': {'shows': ['At most {} shows per batch'.format(MAX_BATCH)]}}]
+
+    rows, errors = [], []
+    for index, record in enumerate(records):
+        if not isinstance(record, dict):
+            errors.append({'row': index, 'errors': {'shows': ['Expected an object']}})
+            continue
+        row, row_errors = validate(ShowForm, record)
+        if row_errors:
+            errors.append({'row': index, 'errors': row_errors})
+        else:
+            rows.append((index, row))
+    if errors or not rows:
+        return [], errors
+
+    for index, row in rows:
+        for column in ('venue_id', 'artiste_id'):
+            try:
+                row[column] = int(row[column])
+            except (TypeError, ValueError):
+                errors.append({'row': index, 'errors': {column: ['Not a valid id']}})
+    if errors:
+        return [], errors
+
+    venue_ids = set(row['venue_id'] for index, row in rows)
+    artist_ids = set(row['artiste_id'] for index, row in rows)
+    known_venues = set(id_ for id_, in db.session.query(Venue.id).filter(Venue.id.in_(venue_ids)))
+    known_artists = set(id_ for id_, in db.session.query(Artiste.id).filter(Artiste.id.in_(artist_ids)))
+    for index, row in rows:
+        row_errors = {}
+        if row['venue_id'] not in known_venues:
+            row_errors['venue_id'] = ['No such venue: {}'.format(row['venue_id'])]
+        if row['artiste_id'] not in known_artists:
+            row_errors['artiste_id'] = ['No such artiste: {}'.format(row['artiste_id'])]
+        if row_errors:
+            errors.append({'row': index, 'errors': row_errors})
+    if errors:
+        return [], errors
+
+    clashes = double_bookings([row for index, row in rows])
+    for position, clash in sorted(clashes.items()):
+        index, row = rows[position]
+        errors.append({'row': index, 'errors': {'start_time': [booking_error(row['venue_id'], clash)]}})
+    if errors:
+        return [], errors
+
+    table = Show.__table__
+    values = [row for index, row in rows]
+    try:
+        if db.engine.dialect.name == 'postgresql':
+            ids = [id_ for id_, in db.session.execute(table.insert().values(values).returning(table.c.id))]
+        else:
+            ids = [db.session.execute(table.insert().values(**row)).inserted_primary_key[0] for row in values]
+        # Core inserts bypass the ORM events that maintain the counters
+        refresh_show_counters(venue_ids=venue_ids, artist_ids=artist_ids)
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return [], [{'row': None, 'errors': {'shows': ['A venue in this batch was booked concurrently; '
+                                                       'please retry']}}]
+    return ids, []
@@ -0,0 +1,207 @@
+from collections import defaultdict
+
+from sqlalchemy import case, false, or_, func
+
+from forms import GENRE_CHOICES
+from genres import genre_criteria
+from models import db, Venue, Artiste
+
+SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+# minimum word similarity for a fuzzy (non-substring) name match,
+# the same default pg_trgm uses for its `%>` operator
+SIMILARITY_THRESHOLD = 0.6
+# rank bonus for a match on city, state or genre rather than the name
+FIELD_MATCH_SCORE = 0.5
+
+
+def words(text):
+    return ''.join(c if c.isalnum() else ' ' for c in (text or '').lower()).split()
+
+
+def word_trigrams(word):
+    # pg_trgm style: each word padded with two leading and one trailing space
+    word = '  ' + word + ' '
+    return set(word[i:i + 3] for i in range(len(word) - 2))
+
+
+def trigrams(text):
+    grams = set()
+    for word in words(text):
+        grams |= word_trigrams(word)
+    return grams
+
+
+def word_similarity(query_grams, name_words):
+    # share of the query's trigrams found in the best matching word of the name
+    if not query_grams:
+        return 0.0
+    best = max([len(query_grams & grams) for grams in name_words] or [0])
+    return best / float(len(query_grams))
+
+
+def matching_genres(term):
+    term = term.strip().lower()
+    if not term:
+        return []
+    return [value for value, label in GENRE_CHOICES if term in value.lower()]
+
+
+# ----------------------------------------------------------------------------#
+# In-memory fallback.
+# ----------------------------------------------------------------------------#
+class InvertedIndex(object):
+    """Trigram inverted index over names plus exact city/state/genre postings.
+
+    Used when the database is not PostgreSQL (e.g. SQLite in tests), and
+    ranks results the same way the pg_trgm query does.
+    """
+
+    def __init__(self):
+        self.docs = {}
+        self.name_postings = defaultdict(set)
+        self.field_postings = defaultdict(set)
+
+    def add(self, doc_id, name, city=None, state=None, genres=None):
+        self.remove(doc_id)
+        name_words = [word_trigrams(word) for word in words(name)]
+        grams = set().union(*name_words)
+        fields = set(value.strip().lower() for value in [city, state] + list(genres or []) if value)
+        self.docs[doc_id] = {'name': name or '', 'words': name_words, 'grams': grams, 'fields': fields,
+                             'genres': set(genres or ())}
+        for gram in grams:
+            self.name_postings[gram].add(doc_id)
+        for field in fields:
+            self.field_postings[field].add(doc_id)
+
+    def remove(self, doc_id):
+        doc = self.docs.pop(doc_id, None)
+        if doc is None:
+            return
+        for gram in doc['grams']:
+            self.name_postings[gram].discard(doc_id)
+        for field in doc['fields']:
+            self.field_postings[field].discard(doc_id)
+
+    def search(self, term, limit=SEARCH_LIMIT, genres=()):
+        """The best `limit` matches for `term` (all of them when None) among docs with every genre in `genres`."""
+        term = (term or '').strip()
+        if not term:
+            return []
+        lowered = term.lower()
+        query_grams = trigrams(term)
+
+        candidates = set(self.field_postings.get(lowered, ()))
+        for genre in matching_genres(term):
+            candidates |= self.field_postings.get(genre.lower(), set())
+        field_hits = set(candidates)
+        for gram in query_grams:
+            candidates |= self.name_postings.get(gram, set())
+        if len(lowered) < 3:
+            # too short for trigrams; substring matches need a scan, as in pg_trgm
+            candidates.update(self.docs)
+
+        scored = []
+        for doc_id in candidates:
+            doc = self.docs[doc_id]
+            if not doc['genres'].issuperset(genres):
+                continue
+            score = word_similarity(query_grams, doc['words'])
+            if lowered in doc['name'].lower():
+                score += 1.0
+            elif doc_id in field_hits:
+                score = max(score, FIELD_MATCH_SCORE)
+            elif score < SIMILARITY_THRESHOLD:
+                continue
+            scored.append((-score, doc['name'], doc_id))
+
+        scored.sort()
+        return [{'id': doc_id, 'name': name} for score, name, doc_id in scored[:limit]]
+
+
+# fallback indexes keyed by model, built lazily and dropped after a write
+fallback_indexes = {}
+
+
+def fallback_index(model):
+    if model not in fallback_indexes:
+        index = InvertedIndex()
+        rows = db.session.query(model.id, model.name, model.city, model.state, model.genres)
+        for row in rows:
+            index.add(row.id, row.name, row.city, row.state, row.genres)
+        fallback_indexes[model] = index
+    return fallback_indexes[model]
+
+
+def invalidate_search_index(model):
+    fallback_indexes.pop(model, None)
+
+
+# ----------------------------------------------------------------------------#
+# Search.
+# ----------------------------------------------------------------------------#
+def escape_like(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def postgres_match_condition(model, term):
+    pattern = '%' + escape_like(term) + '%'
+    conditions = [model.name.ilike(pattern, escape='\\'),
+                  model.name.op('%>')(term),
+                  model.city.ilike(escape_like(term), escape='\\'),
+                  model.state.ilike(escape_like(term), escape='\\')]
+    genres = matching_genres(term)
+    if genres:
+        conditions.append(model.genres.overlap(genres))
+    # every condition above is served by the trigram / GIN indexes
+    return or_(*conditions)
+
+
+def postgres_search_query(model, term, limit=SEARCH_LIMIT, genres=()):
+    pattern = '%' + escape_like(term) + '%'
+    rank = func.greatest(
+        func.word_similarity(term, model.name) + case([(model.name.ilike(pattern, escape='\\'), 1.0)], else_=0.0),
+        case([(model.name.op('%>')(term), 0.0)], else_=FIELD_MATCH_SCORE))
+    # the genre filter applies before the limit, so it cannot empty a page of other matches
+    return db.session.query(model.id, model.name) \
+        .filter(postgres_match_condition(model, term), *genre_criteria(model, genres)) \
+        .order_by(rank.desc(), model.name, model.id) \
+        .limit(limit)
+
+
+def postgres_search(model, term, limit, genres):
+    rows = postgres_search_query(model, term, limit, genres).all()
+    return [{'id': row.id, 'name': row.name} for row in rows]
+
+
+def page_limit(limit):
+    # the number of results `search` returns at most for a requested limit
+    return max(1, min(limit or SEARCH_LIMIT, MAX_SEARCH_LIMIT))
+
+
+def search(model, term, limit=SEARCH_LIMIT, genres=()):
+    term = (term or '').strip()
+    if not term:
+        return []
+    limit = page_limit(limit)
+    if db.engine.dialect.name == 'postgresql':
+        return postgres_search(model, term, limit, genres)
+    return fallback_index(model).search(term, limit, genres)
+
+
+def match_criteria(model, term, genres=()):
+    """Criteria selecting every row `search` matches, not just the first page; for facet counts."""
+    term = (term or '').strip()
+    if not term:
+        return [false()]
+    if db.engine.dialect.name == 'postgresql':
+        return [postgres_match_condition(model, term)] + genre_criteria(model, genres)
+    return [model.id.in_([match['id'] for match in fallback_index(model).search(term, None, genres)])]
+
+
+def search_venues(term, limit=SEARCH_LIMIT, genres=()):
+    return search(Venue, term, limit, genres)
+
+
+def search_artists(term, limit=SEARCH_LIMIT, genres=()):
+    return search(Artiste, term, limit, genres)
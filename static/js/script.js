@@ -2,3 +2,29 @@ window.parseISOString = function parseISOString(s) {
   var b = s.split(/\D+/);
   return new Date(Date.UTC(b[0], --b[1], b[2], b[3], b[4], b[5], b[6]));
 };
+
+// suggest venue/artist names in the navbar search box from /api/typeahead
+(function() {
+  var inputs = document.querySelectorAll('input[data-typeahead]');
+  Array.prototype.forEach.call(inputs, function(input) {
+    var list = document.getElementById(input.getAttribute('list'));
+    var pending = null;
+    input.addEventListener('input', function() {
+      var q = input.value;
+      if (pending) { pending.abort(); }
+      if (!q) { list.innerHTML = ''; return; }
+      pending = new XMLHttpRequest();
+      pending.open('GET', '/api/typeahead?type=' + input.getAttribute('data-typeahead') + '&q=' + encodeURIComponent(q));
+      pending.onload = function() {
+        var results = JSON.parse(this.responseText).results;
+        list.innerHTML = '';
+        results.forEach(function(result) {
+          var option = document.createElement('option');
+          option.value = result.name;
+          list.appendChild(option);
+        });
+      };
+      pending.send();
+    });
+  });
+})();
@@ -0,0 +1,39 @@
+import os
+
+from bulk_import import read_records, save_checkpoint, load_checkpoint, remove_checkpoint, checkpoint_path
+
+
+def test_malformed_jsonl_lines_become_record_errors(tmp_path):
+    path = tmp_path / 'venues.jsonl'
+    path.write_text('{"name": "The Musical Hop"}\n'
+                    '{"name": "truncated\n'
+                    '\n'
+                    '["not", "an", "object"]\n'
+                    '{"name": "Park Square"}\n', encoding='utf-8')
+    records = list(read_records(str(path)))
+    assert [(line, record) for line, record, errors in records] == [
+        (1, {'name': 'The Musical Hop'}), (2, None), (4, None), (5, {'name': 'Park Square'})]
+    assert records[1][2]['record'][0].startswith('Not valid JSON')
+    assert records[2][2] == {'record': ['Expected a JSON object']}
+    assert records[0][2] is None
+
+
+def test_csv_records_carry_their_line_numbers(tmp_path):
+    path = tmp_path / 'artists.csv'
+    path.write_text('name,city\nGuns N Petals,San Francisco\nMatt Quevedo,New York\n', encoding='utf-8')
+    assert list(read_records(str(path))) == [
+        (2, {'name': 'Guns N Petals', 'city': 'San Francisco'}, None),
+        (3, {'name': 'Matt Quevedo', 'city': 'New York'}, None)]
+
+
+def test_checkpoint_only_applies_to_the_file_it_was_written_for(tmp_path):
+    path = tmp_path / 'artists.jsonl'
+    path.write_text('{"name": "A"}\n', encoding='utf-8')
+    save_checkpoint(str(path), 1)
+    assert load_checkpoint(str(path)) == 1
+    # a new file saved at the same path starts from the beginning
+    path.write_text('{"name": "B"}\n{"name": "C"}\n', encoding='utf-8')
+    assert load_checkpoint(str(path)) == 0
+    remove_checkpoint(str(path))
+    assert not os.path.exists(checkpoint_path(str(path)))
+    remove_checkpoint(str(path))
@@ -0,0 +1,35 @@
+from datetime import datetime
+
+from flask import Flask
+from werkzeug.datastructures import MultiDict
+
+from forms import ShowForm, validate
+
+
+def parse_start_time(value):
+    # Flask-WTF forms need a request context
+    with Flask(__name__).test_request_context():
+        form = ShowForm(formdata=MultiDict({'artiste_id': '1', 'venue_id': '1', 'start_time': value}),
+                        meta={'csrf': False})
+        return form.start_time.data if form.validate() else form.errors
+
+
+def test_show_start_time_accepts_the_placeholder_and_iso_layouts():
+    expected = datetime(2035, 4, 1, 20, 30)
+    for value in ('2035-04-01 20:30', '2035-04-01 20:30:00', '2035-04-01T20:30', '2035-04-01T20:30:00'):
+        assert parse_start_time(value) == expected
+    assert parse_start_time('2035-04-01T20:30:00.500000') == datetime(2035, 4, 1, 20, 30, 0, 500000)
+
+
+def test_show_start_time_rejects_other_text():
+    assert 'start_time' in parse_start_time('next friday')
+    assert 'start_time' in parse_start_time('')
+
+
+def test_records_must_carry_a_start_time():
+    with Flask(__name__).test_request_context():
+        for record in ({'artiste_id': 1, 'venue_id': 1}, {'artiste_id': 1, 'venue_id': 1, 'start_time': None}):
+            row, errors = validate(ShowForm, record)
+            assert row is None and 'start_time' in errors
+        row, errors = validate(ShowForm, {'artiste_id': 1, 'venue_id': 1, 'start_time': '2035-04-01 20:30'})
+        assert errors is None and row['start_time'] == datetime(2035, 4, 1, 20, 30) and row['duration'] == 120
@@ -0,0 +1,32 @@
+from datetime import datetime
+
+from sqlalchemy import DateTime, Integer, String, column
+
+from pagination import decode_cursor, encode_cursor
+
+SHOW_KEYS = (column('start_time', DateTime), column('id', Integer))
+ARTIST_KEYS = (column('name', String), column('id', Integer))
+
+
+def test_cursor_round_trips_datetimes_and_strings():
+    start = datetime(2035, 4, 1, 20, 30)
+    assert decode_cursor(encode_cursor([start, 7]), SHOW_KEYS) == [start, 7]
+    assert decode_cursor(encode_cursor(['Guns N Petals', 4]), ARTIST_KEYS) == ['Guns N Petals', 4]
+
+
+def test_cursor_is_url_safe_without_padding():
+    token = encode_cursor(['?&/+= ünïcode', 123456])
+    assert '=' not in token
+    assert all(c.isalnum() or c in '-_' for c in token)
+    assert decode_cursor(token, ARTIST_KEYS) == ['?&/+= ünïcode', 123456]
+
+
+def test_cursor_keeps_null_values():
+    assert decode_cursor(encode_cursor([None, 3]), SHOW_KEYS) == [None, 3]
+
+
+def test_malformed_cursors_decode_to_none():
+    assert decode_cursor('not a cursor!', SHOW_KEYS) is None
+    assert decode_cursor(encode_cursor({'a': 1}), SHOW_KEYS) is None
+    assert decode_cursor(encode_cursor([1, 2, 3]), SHOW_KEYS) is None
+    assert decode_cursor(encode_cursor(['yesterday', 1]), SHOW_KEYS) is None
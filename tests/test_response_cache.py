@@ -0,0 +1,62 @@
+import threading
+import time
+
+from response_cache import ResponseCache
+
+
+def test_invalidate_evicts_tagged_entries():
+    cache = ResponseCache(1024)
+    cache.set('/venues/1', b'venue', 'text/html', {'venue:1'})
+    cache.set('/venues', b'venues', 'text/html', {'venues', 'venue:1'})
+    cache.set('/artists/2', b'artist', 'text/html', {'artist:2'})
+    cache.invalidate('venue:1')
+    assert cache.get('/venues/1') is None and cache.get('/venues') is None
+    assert cache.get('/artists/2')['body'] == b'artist'
+
+
+def test_entries_expire_after_max_age():
+    cache = ResponseCache(1024, max_age=30)
+    now = time.time()
+    assert now + 29 < cache.set('/shows', b'shows', 'text/html')['expires'] <= now + 31
+    # an earlier expiry requested by the view wins
+    assert cache.set('/venues/1', b'venue', 'text/html', expires=now + 5)['expires'] == now + 5
+    cache.set('/artists', b'artists', 'text/html', expires=now - 1)
+    assert cache.get('/artists') is None
+
+
+def test_size_bound_evicts_least_recently_used():
+    cache = ResponseCache(10)
+    cache.set('a', b'aaaa', 'text/html')
+    cache.set('b', b'bbbb', 'text/html')
+    cache.get('a')
+    cache.set('c', b'cccc', 'text/html')
+    assert cache.get('b') is None
+    assert cache.get('a') is not None and cache.get('c') is not None
+    assert cache.size == 8
+
+
+def test_concurrent_use_keeps_size_and_tags_consistent():
+    cache = ResponseCache(200, max_age=30)
+    errors = []
+
+    def worker(n):
+        try:
+            for i in range(2000):
+                key = '/venues/%d' % (i % 13)
+                cache.set(key, b'x' * ((i + n) % 40), 'text/html', {'venues', 'venue:%d' % (i % 5)})
+                cache.get('/venues/%d' % ((i + n) % 13))
+                if i % 7 == 0:
+                    cache.invalidate('venue:%d' % (i % 5))
+                if i % 11 == 0:
+                    cache.discard(key)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert cache.size == sum(len(entry['body']) for entry in cache.entries.values()) <= 200
+    assert all(key in cache.entries for keys in cache.tagged.values() for key in keys)
@@ -0,0 +1,81 @@
+from search import InvertedIndex, trigrams, word_trigrams, words
+
+
+def build_index():
+    index = InvertedIndex()
+    index.add(1, 'The Musical Hop', 'San Francisco', 'CA', ['Jazz', 'Reggae', 'Swing'])
+    index.add(2, 'The Dueling Pianos Bar', 'New York', 'NY', ['Classical', 'R&B'])
+    index.add(3, 'Park Square Live Music & Coffee', 'San Francisco', 'CA', ['Rock n Roll', 'Jazz'])
+    index.add(4, 'Guns N Petals', 'San Francisco', 'CA', ['Rock n Roll'])
+    return index
+
+
+def ids(results):
+    return [result['id'] for result in results]
+
+
+def test_words_lowercases_and_splits_on_punctuation():
+    assert words("Park Square Live Music & Coffee") == ['park', 'square', 'live', 'music', 'coffee']
+    assert words("Guns-N'Petals") == ['guns', 'n', 'petals']
+    assert words(None) == []
+
+
+def test_word_trigrams_are_padded_like_pg_trgm():
+    assert word_trigrams('hop') == {'  h', ' ho', 'hop', 'op '}
+    assert trigrams('a b') == {'  a', ' a ', '  b', ' b '}
+
+
+def test_whole_word_outranks_substring():
+    results = build_index().search('music')
+    assert ids(results) == [3, 1]
+    assert results[1] == {'id': 1, 'name': 'The Musical Hop'}
+
+
+def test_fuzzy_match_tolerates_a_typo():
+    assert ids(build_index().search('pianoz')) == [2]
+
+
+def test_unrelated_term_matches_nothing():
+    assert build_index().search('xylophone') == []
+    assert build_index().search('   ') == []
+
+
+def test_city_state_and_genre_match_exactly():
+    index = build_index()
+    assert sorted(ids(index.search('san francisco'))) == [1, 3, 4]
+    assert ids(index.search('ny')) == [2]
+    assert sorted(ids(index.search('jazz'))) == [1, 3]
+
+
+def test_name_match_outranks_field_match():
+    index = build_index()
+    index.add(5, 'Jazz Corner', 'Austin', 'TX', ['Blues'])
+    assert ids(index.search('jazz'))[0] == 5
+
+
+def test_short_terms_fall_back_to_substring_scan():
+    assert ids(build_index().search('n p')) == [4]
+
+
+def test_results_are_limited_and_ties_broken_by_name():
+    # 'ca' is in the name of The Musical Hop; the other two only match on state
+    results = build_index().search('ca', limit=3)
+    assert [result['name'] for result in results] == ['The Musical Hop', 'Guns N Petals',
+                                                      'Park Square Live Music & Coffee']
+    assert ids(build_index().search('ca', limit=1)) == [1]
+
+
+def test_genre_filter_applies_before_the_limit():
+    # The Musical Hop ranks first for 'ca' but is not Rock n Roll
+    assert ids(build_index().search('ca', limit=1, genres=['Rock n Roll'])) == [4]
+    assert ids(build_index().search('ca', limit=None, genres=['Rock n Roll', 'Jazz'])) == [3]
+
+
+def test_add_replaces_and_remove_drops_a_document():
+    index = build_index()
+    index.add(4, 'Guns N Roses', 'Los Angeles', 'CA', [])
+    assert build_index().search('petals') and index.search('petals') == []
+    assert ids(index.search('roses')) == [4]
+    index.remove(4)
+    index.remove(4)
+    assert index.search('roses') == []
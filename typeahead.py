@@ -0,0 +1,50 @@
+from bisect import bisect_left, insort
+
+TYPEAHEAD_LIMIT = 10
+
+
+class PrefixIndex(object):
+    """Sorted array of lowercase names answering prefix queries with bisect.
+
+    Entries are (key, kind, id, name) tuples, so names shared by a venue and
+    an artist, or by two venues, stay distinct. `add`/`remove` keep the array
+    sorted, so the index is updated in place on every write.
+    """
+
+    def __init__(self):
+        self.entries = []
+        self.keys = {}
+
+    def add(self, kind, doc_id, name):
+        self.remove(kind, doc_id)
+        if not name:
+            return
+        entry = (name.strip().lower(), kind, doc_id, name)
+        insort(self.entries, entry)
+        self.keys[(kind, doc_id)] = entry
+
+    def remove(self, kind, doc_id):
+        entry = self.keys.pop((kind, doc_id), None)
+        if entry is None:
+            return
+        i = bisect_left(self.entries, entry)
+        if i < len(self.entries) and self.entries[i] == entry:
+            del self.entries[i]
+
+    def complete(self, prefix, limit=TYPEAHEAD_LIMIT, kind=None):
+        prefix = (prefix or '').strip().lower()
+        if not prefix:
+            return []
+        results = []
+        i = bisect_left(self.entries, (prefix,))
+        while i < len(self.entries) and len(results) < limit:
+            key, entry_kind, doc_id, name = self.entries[i]
+            if not key.startswith(prefix):
+                break
+            if kind is None or entry_kind == kind:
+                results.append({'type': entry_kind, 'id': doc_id, 'name': name})
+            i += 1
+        return results
+
+    def __len__(self):
+        return len(self.entries)